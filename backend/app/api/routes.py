@@ -1,14 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional, List
+from datetime import date
+from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.database import get_db
-from app.services.services import CompanyService, ScreenerService, FinancialReportService, TrendAnalysisService
+from app.services.cache import response_cache
+from app.services.screener_engine import screener_engine
+from app.services.services import (
+    CompanyService, ScreenerService, FinancialReportService, TrendAnalysisService, IndustryService,
+    InvalidCursor
+)
 from app.models.schemas import (
     CompanyResponse, CompanyDetail, ScreenerFilter,
     ScreenerResult, FinancialReportResponse, TrendAnalysisResponse,
-    PaginatedResponse
+    TrendHistoryResponse, IndustryBenchmarkResponse, PaginatedResponse
 )
+from app.models.models import Company
 
 router = APIRouter(prefix="/api", tags=["stocks"])
 
@@ -16,17 +24,22 @@ router = APIRouter(prefix="/api", tags=["stocks"])
 async def get_companies(
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; replaces page"),
     db: AsyncSession = Depends(get_db)
 ):
     service = CompanyService(db)
     skip = (page - 1) * page_size
-    companies, total = await service.get_all(skip=skip, limit=page_size)
+    try:
+        companies, total, next_cursor = await service.get_all(skip=skip, limit=page_size, cursor=cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
     return PaginatedResponse(
         total=total,
         page=page,
         page_size=page_size,
-        items=[CompanyResponse.model_validate(c) for c in companies]
+        items=[CompanyResponse.model_validate(c) for c in companies],
+        next_cursor=next_cursor
     )
 
 @router.get("/companies/{stock_code}", response_model=CompanyDetail)
@@ -34,11 +47,14 @@ async def get_company_detail(
     stock_code: str,
     db: AsyncSession = Depends(get_db)
 ):
-    service = CompanyService(db)
-    company = await service.get_detail(stock_code)
-    if not company:
-        raise HTTPException(status_code=404, detail="Company not found")
-    return company
+    async def build():
+        service = CompanyService(db)
+        company = await service.get_detail(stock_code)
+        if not company:
+            raise HTTPException(status_code=404, detail="Company not found")
+        return company
+    
+    return await response_cache.get_or_build("company", build, CompanyDetail, stock_code=stock_code)
 
 @router.get("/companies/{stock_code}/financial-reports", response_model=List[FinancialReportResponse])
 async def get_financial_reports(
@@ -46,18 +62,46 @@ async def get_financial_reports(
     years: Optional[int] = Query(None, ge=1, le=10),
     db: AsyncSession = Depends(get_db)
 ):
-    company_service = CompanyService(db)
-    company = await company_service.get_by_code(stock_code)
-    if not company:
-        raise HTTPException(status_code=404, detail="Company not found")
+    async def build():
+        company_service = CompanyService(db)
+        company = await company_service.get_by_code(stock_code)
+        if not company:
+            raise HTTPException(status_code=404, detail="Company not found")
+        
+        report_service = FinancialReportService(db)
+        return await report_service.get_by_company(company.id, years=years)
     
-    report_service = FinancialReportService(db)
-    return await report_service.get_by_company(company.id, years=years)
+    return await response_cache.get_or_build(
+        "financial_reports", build, List[FinancialReportResponse],
+        stock_code=stock_code, params={"years": years}
+    )
 
 @router.get("/companies/{stock_code}/trend", response_model=TrendAnalysisResponse)
 async def get_trend_analysis(
     stock_code: str,
     db: AsyncSession = Depends(get_db)
+):
+    async def build():
+        company_service = CompanyService(db)
+        company = await company_service.get_by_code(stock_code)
+        if not company:
+            raise HTTPException(status_code=404, detail="Company not found")
+        
+        trend_service = TrendAnalysisService(db)
+        trend = await trend_service.get_latest(company.id)
+        if not trend:
+            raise HTTPException(status_code=404, detail="Trend analysis not found")
+        return trend
+    
+    return await response_cache.get_or_build("trend", build, TrendAnalysisResponse, stock_code=stock_code)
+
+@router.get("/companies/{stock_code}/trend/history", response_model=TrendHistoryResponse)
+async def get_trend_history(
+    stock_code: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    window: int = Query(1278, ge=60, le=2500),
+    db: AsyncSession = Depends(get_db)
 ):
     company_service = CompanyService(db)
     company = await company_service.get_by_code(stock_code)
@@ -65,35 +109,53 @@ async def get_trend_analysis(
         raise HTTPException(status_code=404, detail="Company not found")
     
     trend_service = TrendAnalysisService(db)
-    trend = await trend_service.get_latest(company.id)
-    if not trend:
-        raise HTTPException(status_code=404, detail="Trend analysis not found")
-    return trend
+    return await trend_service.get_history(company.id, start=start, end=end, window=window)
 
 @router.post("/screener", response_model=ScreenerResult)
 async def screen_stocks(
     filters: ScreenerFilter,
     page: int = Query(1, ge=1),
     page_size: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page; replaces page"),
     db: AsyncSession = Depends(get_db)
 ):
     service = ScreenerService(db)
     skip = (page - 1) * page_size
-    return await service.screen(filters, skip=skip, limit=page_size)
+    try:
+        if screener_engine.ready:
+            return screener_engine.screen(filters, skip=skip, limit=page_size, cursor=cursor)
+        return await service.screen(filters, skip=skip, limit=page_size, cursor=cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/industries")
 async def get_industries(db: AsyncSession = Depends(get_db)):
-    from sqlalchemy import select, func, distinct
-    from app.models.models import Company
+    async def build():
+        result = await db.execute(
+            select(Company.industry, func.count(Company.id))
+            .where(Company.industry.isnot(None))
+            .group_by(Company.industry)
+            .order_by(func.count(Company.id).desc())
+        )
+        return [{"name": row[0], "count": row[1]} for row in result.all()]
+    
+    return await response_cache.get_or_build("industries", build)
+
+@router.get("/industries/{industry}/benchmarks", response_model=IndustryBenchmarkResponse)
+async def get_industry_benchmarks(
+    industry: str,
+    year: Optional[int] = None,
+    season: Optional[int] = Query(None, ge=1, le=4),
+    db: AsyncSession = Depends(get_db)
+):
+    async def build():
+        service = IndustryService(db)
+        return await service.get_benchmarks(industry, year=year, season=season)
     
-    result = await db.execute(
-        select(Company.industry, func.count(Company.id))
-        .where(Company.industry.isnot(None))
-        .group_by(Company.industry)
-        .order_by(func.count(Company.id).desc())
+    return await response_cache.get_or_build(
+        "industry_benchmarks", build, IndustryBenchmarkResponse,
+        params={"industry": industry, "year": year, "season": season}
     )
-    industries = [{"name": row[0], "count": row[1]} for row in result.all()]
-    return industries
 
 @router.get("/signals")
 async def get_signals():
@@ -6,6 +6,8 @@ class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379/0"
     cors_origins: str = "http://localhost:3000"
     debug: bool = False
+    # Serve /api/screener from NumPy arrays held in each API process
+    in_memory_screener: bool = False
     
     class Config:
         env_file = ".env"
@@ -1,15 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 
 from app.core.config import get_settings
 from app.api.routes import router as api_router
+from app.services.cache import response_cache
+from app.services.screener_engine import screener_engine
 
 settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    tasks = [asyncio.create_task(response_cache.listen())]
+    if settings.in_memory_screener:
+        response_cache.subscribe(screener_engine.invalidate)
+        tasks.append(asyncio.create_task(screener_engine.run()))
     yield
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await response_cache.close()
 
 app = FastAPI(
     title="台股財報分析系統",
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, BigInteger, Numeric, Date, Boolean, Text, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, BigInteger, Numeric, Date, DateTime, Boolean, Text, ForeignKey, CheckConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.database import Base
@@ -14,6 +14,7 @@ class Company(Base):
     market = Column(String(20))
     listing_date = Column(Date)
     capital = Column(BigInteger)
+    delisted_date = Column(Date)
     
     financial_reports = relationship("FinancialReport", back_populates="company", cascade="all, delete-orphan")
     stock_prices = relationship("StockPrice", back_populates="company", cascade="all, delete-orphan")
@@ -40,6 +41,7 @@ class FinancialReport(Base):
     goodwill = Column(BigInteger)
     short_term_debt = Column(BigInteger)
     long_term_debt = Column(BigInteger)
+    common_stock = Column(BigInteger)
     
     revenue = Column(BigInteger)
     cost_of_goods_sold = Column(BigInteger)
@@ -74,6 +76,7 @@ class StockPrice(Base):
     turnover = Column(BigInteger)
     change_amount = Column(Numeric(10, 2))
     change_percent = Column(Numeric(5, 2))
+    updated_at = Column(DateTime)
     
     company = relationship("Company", back_populates="stock_prices")
 
@@ -111,6 +114,7 @@ class Indicator(Base):
     goodwill_ratio = Column(Numeric(8, 4))
     short_debt_to_cash = Column(Numeric(8, 4))
     short_debt_to_ev = Column(Numeric(8, 4))
+    landmine_flags = Column(Integer, nullable=False, default=0)
     f_score = Column(Integer)
     cbs_score = Column(Integer)
     signal = Column(String(20))
@@ -133,6 +137,110 @@ class TrendAnalysis(Base):
     position = Column(String(20))
     r_squared = Column(Numeric(8, 6))
 
+class IndicatorSnapshot(Base):
+    """Read-only mapping of the latest_indicator_snapshot materialized view."""
+    __tablename__ = "latest_indicator_snapshot"
+    
+    company_id = Column(Integer, primary_key=True)
+    stock_code = Column(String(10))
+    name = Column(String(100))
+    name_abbr = Column(String(50))
+    industry = Column(String(50))
+    market = Column(String(20))
+    listing_date = Column(Date)
+    capital = Column(BigInteger)
+    delisted_date = Column(Date)
+    
+    indicator_id = Column(Integer)
+    report_date = Column(Date)
+    year = Column(Integer)
+    season = Column(Integer)
+    roe = Column(Numeric(8, 4))
+    net_margin = Column(Numeric(8, 4))
+    asset_turnover = Column(Numeric(8, 4))
+    equity_multiplier = Column(Numeric(8, 4))
+    gross_margin = Column(Numeric(8, 4))
+    operating_margin = Column(Numeric(8, 4))
+    inventory_turnover = Column(Numeric(8, 4))
+    inventory_turnover_days = Column(Integer)
+    accounts_receivable_turnover_days = Column(Integer)
+    cash_conversion_cycle = Column(Integer)
+    current_ratio = Column(Numeric(8, 4))
+    quick_ratio = Column(Numeric(8, 4))
+    debt_ratio = Column(Numeric(8, 4))
+    interest_coverage = Column(Numeric(8, 4))
+    cash_ratio = Column(Numeric(8, 4))
+    cash_flow_ratio = Column(Numeric(8, 4))
+    free_cash_flow_per_share = Column(Numeric(10, 4))
+    pe_ratio = Column(Numeric(8, 4))
+    pe_ttm = Column(Numeric(8, 4))
+    pb_ratio = Column(Numeric(8, 4))
+    ps_ratio = Column(Numeric(8, 4))
+    dividend_yield = Column(Numeric(8, 4))
+    goodwill_ratio = Column(Numeric(8, 4))
+    short_debt_to_cash = Column(Numeric(8, 4))
+    short_debt_to_ev = Column(Numeric(8, 4))
+    landmine_flags = Column(Integer)
+    f_score = Column(Integer)
+    cbs_score = Column(Integer)
+    signal = Column(String(20))
+    
+    price_id = Column(Integer)
+    price_date = Column(Date)
+    open = Column(Numeric(10, 2))
+    high = Column(Numeric(10, 2))
+    low = Column(Numeric(10, 2))
+    close = Column(Numeric(10, 2))
+    volume = Column(BigInteger)
+    change_percent = Column(Numeric(5, 2))
+    
+    # Percentile (0-100, ascending) across the whole market and within the industry
+    roe_market_pct = Column(Numeric(5, 2))
+    roe_industry_pct = Column(Numeric(5, 2))
+    net_margin_market_pct = Column(Numeric(5, 2))
+    net_margin_industry_pct = Column(Numeric(5, 2))
+    gross_margin_market_pct = Column(Numeric(5, 2))
+    gross_margin_industry_pct = Column(Numeric(5, 2))
+    operating_margin_market_pct = Column(Numeric(5, 2))
+    operating_margin_industry_pct = Column(Numeric(5, 2))
+    asset_turnover_market_pct = Column(Numeric(5, 2))
+    asset_turnover_industry_pct = Column(Numeric(5, 2))
+    current_ratio_market_pct = Column(Numeric(5, 2))
+    current_ratio_industry_pct = Column(Numeric(5, 2))
+    quick_ratio_market_pct = Column(Numeric(5, 2))
+    quick_ratio_industry_pct = Column(Numeric(5, 2))
+    debt_ratio_market_pct = Column(Numeric(5, 2))
+    debt_ratio_industry_pct = Column(Numeric(5, 2))
+    cash_ratio_market_pct = Column(Numeric(5, 2))
+    cash_ratio_industry_pct = Column(Numeric(5, 2))
+    pe_ttm_market_pct = Column(Numeric(5, 2))
+    pe_ttm_industry_pct = Column(Numeric(5, 2))
+    pb_ratio_market_pct = Column(Numeric(5, 2))
+    pb_ratio_industry_pct = Column(Numeric(5, 2))
+    ps_ratio_market_pct = Column(Numeric(5, 2))
+    ps_ratio_industry_pct = Column(Numeric(5, 2))
+    dividend_yield_market_pct = Column(Numeric(5, 2))
+    dividend_yield_industry_pct = Column(Numeric(5, 2))
+    f_score_market_pct = Column(Numeric(5, 2))
+    f_score_industry_pct = Column(Numeric(5, 2))
+    cbs_score_market_pct = Column(Numeric(5, 2))
+    cbs_score_industry_pct = Column(Numeric(5, 2))
+
+class IndustryIndicatorStat(Base):
+    __tablename__ = "industry_indicator_stats"
+    
+    industry = Column(String(50), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    season = Column(Integer, primary_key=True)
+    indicator = Column(String(50), primary_key=True)
+    companies = Column(Integer, nullable=False)
+    p10 = Column(Numeric(14, 4))
+    p25 = Column(Numeric(14, 4))
+    median = Column(Numeric(14, 4))
+    p75 = Column(Numeric(14, 4))
+    p90 = Column(Numeric(14, 4))
+    mean = Column(Numeric(14, 4))
+
 class CrawlerLog(Base):
     __tablename__ = "crawler_logs"
     
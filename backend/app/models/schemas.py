@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Literal, get_args
 from datetime import date
 from decimal import Decimal
 
@@ -11,6 +11,7 @@ class CompanyBase(BaseModel):
     market: Optional[str] = None
     listing_date: Optional[date] = None
     capital: Optional[int] = None
+    delisted_date: Optional[date] = None
 
 class CompanyResponse(CompanyBase):
     id: int
@@ -58,8 +59,16 @@ class IndicatorResponse(IndicatorBase):
     quick_ratio: Optional[Decimal]
     debt_ratio: Optional[Decimal]
     cash_ratio: Optional[Decimal]
+    pe_ratio: Optional[Decimal] = None
     pe_ttm: Optional[Decimal]
     pb_ratio: Optional[Decimal]
+    ps_ratio: Optional[Decimal] = None
+    dividend_yield: Optional[Decimal] = None
+    interest_coverage: Optional[Decimal] = None
+    goodwill_ratio: Optional[Decimal] = None
+    short_debt_to_cash: Optional[Decimal] = None
+    short_debt_to_ev: Optional[Decimal] = None
+    landmine_flags: int = 0
     f_score: Optional[int]
     cbs_score: Optional[int]
     signal: Optional[str]
@@ -83,9 +92,47 @@ class StockPriceResponse(StockPriceBase):
     class Config:
         from_attributes = True
 
+# Indicators ranked across the whole market and within the industry in the screener snapshot
+RankColumn = Literal[
+    "roe", "net_margin", "gross_margin", "operating_margin", "asset_turnover",
+    "current_ratio", "quick_ratio", "debt_ratio", "cash_ratio",
+    "pe_ttm", "pb_ratio", "ps_ratio", "dividend_yield", "f_score", "cbs_score"
+]
+PercentileScope = Literal["market", "industry"]
+PercentileColumn = Literal[tuple(
+    f"{column}_{scope}_pct" for column in get_args(RankColumn) for scope in get_args(PercentileScope)
+)]
+
+# Screener sort keys: every numeric snapshot column and every percentile.
+# The common screens have matching indexes; other keys are a plain ORDER BY
+# over the snapshot, or a precomputed rank in the in-memory engine
+SortColumn = Literal[tuple([
+    "roe", "net_margin", "asset_turnover", "equity_multiplier", "gross_margin", "operating_margin",
+    "inventory_turnover", "inventory_turnover_days", "accounts_receivable_turnover_days", "cash_conversion_cycle",
+    "current_ratio", "quick_ratio", "debt_ratio", "interest_coverage",
+    "cash_ratio", "cash_flow_ratio", "free_cash_flow_per_share",
+    "pe_ratio", "pe_ttm", "pb_ratio", "ps_ratio", "dividend_yield",
+    "goodwill_ratio", "short_debt_to_cash", "short_debt_to_ev", "f_score", "cbs_score"
+] + list(get_args(PercentileColumn)))]
+
 class CompanyDetail(CompanyResponse):
     latest_indicators: Optional[IndicatorResponse] = None
     latest_price: Optional[StockPriceResponse] = None
+    # Keyed by PercentileColumn; only filled on screener results
+    percentiles: Optional[Dict[str, Optional[Decimal]]] = None
+
+LandmineFlag = Literal["debt_servicing", "goodwill", "cash", "leverage", "short_debt"]
+
+class PercentileFilter(BaseModel):
+    # {"column": "roe", "scope": "industry", "min": 90} is ROE in the top 10% of its industry
+    column: RankColumn
+    scope: PercentileScope
+    min: Optional[Decimal] = Field(None, ge=0, le=100)
+    max: Optional[Decimal] = Field(None, ge=0, le=100)
+
+class SortKey(BaseModel):
+    column: SortColumn
+    descending: bool = False
 
 class ScreenerFilter(BaseModel):
     roe_min: Optional[Decimal] = None
@@ -100,10 +147,16 @@ class ScreenerFilter(BaseModel):
     signal: Optional[List[str]] = None
     industry: Optional[List[str]] = None
     market: Optional[List[str]] = None
+    exclude_landmines: Optional[List[LandmineFlag]] = None
+    require_landmines: Optional[List[LandmineFlag]] = None
+    percentiles: Optional[List[PercentileFilter]] = None
+    # NULLs sort last in either direction; stock_code breaks ties
+    sort: Optional[List[SortKey]] = Field(None, max_length=3)
 
 class ScreenerResult(BaseModel):
     total: int
     companies: List[CompanyDetail]
+    next_cursor: Optional[str] = None
 
 class TrendAnalysisResponse(BaseModel):
     company_id: int
@@ -120,8 +173,43 @@ class TrendAnalysisResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class TrendBandPoint(BaseModel):
+    date: date
+    close: float
+    trend_line: Optional[float] = None
+    sd_plus_2: Optional[float] = None
+    sd_plus_1: Optional[float] = None
+    sd_minus_1: Optional[float] = None
+    sd_minus_2: Optional[float] = None
+
+class TrendHistoryResponse(BaseModel):
+    company_id: int
+    window: int
+    as_of: Optional[date]
+    points: List[TrendBandPoint]
+
 class PaginatedResponse(BaseModel):
     total: int
     page: int
     page_size: int
     items: List
+    next_cursor: Optional[str] = None
+
+class IndustryIndicatorStatResponse(BaseModel):
+    indicator: str
+    companies: int
+    p10: Optional[Decimal] = None
+    p25: Optional[Decimal] = None
+    median: Optional[Decimal] = None
+    p75: Optional[Decimal] = None
+    p90: Optional[Decimal] = None
+    mean: Optional[Decimal] = None
+    
+    class Config:
+        from_attributes = True
+
+class IndustryBenchmarkResponse(BaseModel):
+    industry: str
+    year: Optional[int]
+    season: Optional[int]
+    indicators: List[IndustryIndicatorStatResponse]
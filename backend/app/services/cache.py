@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlencode
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "api:"
+# Published by the crawler's tasks.events once a write has committed
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Seconds; invalidation events do the real work, TTLs only bound a missed event
+CACHE_TTLS = {
+    "company": 6 * 3600,
+    "trend": 6 * 3600,
+    "financial_reports": 24 * 3600,
+    "industries": 24 * 3600,
+    "industry_benchmarks": 24 * 3600,
+}
+INDUSTRY_ENDPOINTS = {"industries", "industry_benchmarks"}
+
+# Bumped on every invalidation event; totals are cached per version, so a
+# write makes every cached count unreachable at once. Kept outside
+# CACHE_PREFIX so evict_all cannot reset it to a version already used.
+DATA_VERSION_KEY = "cache:data_version"
+TOTAL_TTL = 3600
+
+RESUBSCRIBE_DELAY = 5
+
+# Stores a built response only if no invalidation event bumped the data
+# version since the build started; handle() bumps it before evicting, so a
+# response built from pre-event data is either refused here or evicted.
+# KEYS: version, entry, index; ARGV: version at build start, body, TTL, index TTL
+WRITE_IF_CURRENT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('SADD', KEYS[3], KEYS[2])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+return 1
+"""
+
+
+class ResponseCache:
+    """Serialized API responses in Redis.
+
+    Each entry is registered in an index set (one per company, one for the
+    industry endpoints) so an invalidation event deletes exactly the keys it
+    affects. A hit is returned as the stored JSON without validating it
+    again and without touching the database.
+    """
+
+    def __init__(self, url: str):
+        self.redis = redis.Redis.from_url(url)
+        self._adapters: Dict[Any, TypeAdapter] = {}
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._write_if_current = self.redis.register_script(WRITE_IF_CURRENT)
+
+    def key(self, endpoint: str, stock_code: Optional[str] = None, params: Optional[Dict] = None) -> str:
+        query = urlencode(sorted((k, v) for k, v in (params or {}).items() if v is not None))
+        return f"{CACHE_PREFIX}{endpoint}:{stock_code or '-'}:{query}"
+
+    def _index(self, endpoint: str, stock_code: Optional[str]) -> str:
+        if endpoint in INDUSTRY_ENDPOINTS:
+            return f"{CACHE_PREFIX}index:industries"
+        return f"{CACHE_PREFIX}index:company:{stock_code}"
+
+    def _serialize(self, result: Any, response_type: Any) -> bytes:
+        # Same JSON FastAPI would produce through response_model
+        if response_type is None:
+            return json.dumps(jsonable_encoder(result), ensure_ascii=False).encode()
+        if response_type not in self._adapters:
+            self._adapters[response_type] = TypeAdapter(response_type)
+        adapter = self._adapters[response_type]
+        return adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+
+    async def get_or_build(
+        self,
+        endpoint: str,
+        build: Callable[[], Awaitable[Any]],
+        response_type: Any = None,
+        stock_code: Optional[str] = None,
+        params: Optional[Dict] = None
+    ) -> Response:
+        key = self.key(endpoint, stock_code, params)
+        try:
+            cached, version = await self.redis.mget(key, DATA_VERSION_KEY)
+        except RedisError as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return Response(self._serialize(await build(), response_type), media_type="application/json")
+        if cached is not None:
+            return Response(cached, media_type="application/json")
+
+        body = self._serialize(await build(), response_type)
+        index = self._index(endpoint, stock_code)
+        try:
+            await self._write_if_current(
+                keys=[DATA_VERSION_KEY, key, index],
+                args=[version or b"0", body, CACHE_TTLS[endpoint], max(CACHE_TTLS.values())]
+            )
+        except RedisError as e:
+            logger.warning(f"Response cache write failed: {e}")
+        return Response(body, media_type="application/json")
+
+    async def cached_total(self, name: str, filters: Dict, count: Callable[[], Awaitable[int]]) -> int:
+        """Row count for `filters` at the current data version."""
+        digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()
+        try:
+            version = int(await self.redis.get(DATA_VERSION_KEY) or 0)
+            key = f"{CACHE_PREFIX}total:{name}:{version}:{digest}"
+            cached = await self.redis.get(key)
+        except RedisError as e:
+            logger.warning(f"Total cache read failed: {e}")
+            return await count()
+        if cached is not None:
+            return int(cached)
+
+        total = await count()
+        try:
+            await self.redis.set(key, total, ex=TOTAL_TTL)
+        except RedisError as e:
+            logger.warning(f"Total cache write failed: {e}")
+        return total
+
+    async def _evict_indexes(self, indexes: Iterable[str]) -> int:
+        evicted = 0
+        for index in indexes:
+            keys = await self.redis.smembers(index)
+            evicted += await self.redis.unlink(index, *keys) if keys else 0
+        return evicted
+
+    async def evict_companies(self, stock_codes: Iterable[str]) -> int:
+        return await self._evict_indexes(self._index("company", code) for code in stock_codes)
+
+    async def evict_industries(self) -> int:
+        return await self._evict_indexes([self._index("industries", None)])
+
+    async def evict_all(self) -> int:
+        evicted = 0
+        batch = []
+        async for key in self.redis.scan_iter(match=f"{CACHE_PREFIX}*", count=1000):
+            batch.append(key)
+            if len(batch) >= 1000:
+                evicted += await self.redis.unlink(*batch)
+                batch = []
+        if batch:
+            evicted += await self.redis.unlink(*batch)
+        return evicted
+
+    def subscribe(self, callback: Callable[[Dict], None]):
+        """Also pass every invalidation event to `callback`."""
+        self._subscribers.append(callback)
+
+    async def handle(self, event: Dict) -> int:
+        await self.redis.incr(DATA_VERSION_KEY)
+        for callback in self._subscribers:
+            callback(event)
+        scope = event.get("scope")
+        if scope == "company":
+            return await self.evict_companies(event.get("stock_codes", []))
+        if scope == "industries":
+            return await self.evict_industries()
+        if scope == "snapshot":
+            # Only the screener snapshot moved; the version bump covers it
+            return 0
+        return await self.evict_all()
+
+    async def listen(self):
+        """Apply invalidation events until cancelled, resubscribing on errors.
+
+        Events published while disconnected are lost, so a resubscribe
+        starts from an empty cache and a new data version.
+        """
+        reconnect = False
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    if reconnect:
+                        await self.handle({"scope": "all"})
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        evicted = await self.handle(json.loads(message["data"]))
+                        logger.debug(f"Invalidation {message['data']!r} evicted {evicted} keys")
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, ValueError) as e:
+                logger.warning(f"Cache invalidation listener failed, resubscribing: {e}")
+                reconnect = True
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    async def close(self):
+        await self.redis.close()
+
+
+response_cache = ResponseCache(get_settings().redis_url)
@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.database import AsyncSessionLocal
+from app.models.models import IndicatorSnapshot
+from app.models.schemas import CompanyDetail, ScreenerFilter, ScreenerResult, SortKey
+from app.services.services import (
+    SCREENER_MEMBERSHIPS, SORT_TYPES,
+    decode_sort_cursor, sort_cursor, range_filters, landmine_masks, snapshot_detail
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds to let a burst of invalidation events settle before reloading
+RELOAD_DELAY = 2
+RELOAD_RETRY_DELAY = 30
+
+# Every filterable column is also sortable
+NUMERIC_COLUMNS = list(SORT_TYPES)
+
+
+class ScreenerUniverse:
+    """One load of latest_indicator_snapshot as column arrays.
+
+    Rows are held in stock_code order, the default order and the final tie-break.
+    NULLs are NaN in the numeric columns and -1 in the label codes, so, as
+    in SQL, no comparison or membership test ever matches them. Each
+    numeric column is also ranked once per load, ascending and descending
+    with NULLs last, so a sorted request never sorts the universe. Never
+    mutated after construction.
+    """
+
+    def __init__(self, rows: List[IndicatorSnapshot]):
+        rows = sorted(rows, key=lambda row: row.stock_code)
+        self.loaded_at = datetime.now()
+        self.stock_codes = np.array([row.stock_code for row in rows], dtype=str)
+        # Raw values are kept for cursors, which must match the SQL path's
+        self.values: Dict[str, list] = {column: [getattr(row, column) for row in rows] for column in NUMERIC_COLUMNS}
+        self.numeric: Dict[str, np.ndarray] = {
+            column: np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+            for column, values in self.values.items()
+        }
+        # (column, descending) -> dense rank per row, NULLs after every value
+        self.ranks: Dict[Tuple[str, bool], np.ndarray] = {}
+        for column, values in self.numeric.items():
+            present = ~np.isnan(values)
+            _, rank = np.unique(values[present], return_inverse=True)
+            ascending = np.full(len(rows), len(rows), dtype=np.int64)
+            descending = ascending.copy()
+            ascending[present] = rank
+            descending[present] = rank.max() - rank if rank.size else rank
+            self.ranks[(column, False)] = ascending
+            self.ranks[(column, True)] = descending
+        self.landmine_flags = np.array([row.landmine_flags or 0 for row in rows], dtype=np.int64)
+        self.categories: Dict[str, Dict[str, int]] = {}
+        self.labels: Dict[str, np.ndarray] = {}
+        for column in SCREENER_MEMBERSHIPS:
+            values = [getattr(row, column) for row in rows]
+            categories = {value: code for code, value in enumerate(sorted({v for v in values if v is not None}))}
+            self.categories[column] = categories
+            self.labels[column] = np.array([categories.get(v, -1) for v in values], dtype=np.int32)
+        # Responses are assembled once per load, not once per request
+        self.details: List[CompanyDetail] = [snapshot_detail(row) for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.details)
+
+    def mask(self, filters: ScreenerFilter) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        for column, bound, value in range_filters(filters):
+            values = self.numeric[column]
+            mask &= values >= float(value) if bound == "min" else values <= float(value)
+        for field in SCREENER_MEMBERSHIPS:
+            wanted = getattr(filters, field)
+            if wanted:
+                codes = [self.categories[field][v] for v in set(wanted) if v in self.categories[field]]
+                mask &= np.isin(self.labels[field], codes)
+        exclude, require = landmine_masks(filters)
+        if exclude:
+            mask &= (self.landmine_flags & exclude) == 0
+        if require:
+            mask &= (self.landmine_flags & require) == require
+        return mask
+
+    def after(self, sort: List[SortKey], values: List, stock_code: str) -> np.ndarray:
+        """Rows past a cursor; mirrors ScreenerService._after."""
+        result = np.zeros(len(self), dtype=bool)
+        ties = np.ones(len(self), dtype=bool)
+        for key, value in zip(sort, values):
+            column = self.numeric[key.column]
+            missing = np.isnan(column)
+            if value is None:
+                ties &= missing
+                continue
+            value = float(value)
+            past = column < value if key.descending else column > value
+            result |= ties & (past | missing)
+            ties &= column == value
+        return result | (ties & (self.stock_codes > stock_code))
+
+    def top(self, sort: List[SortKey], hits: np.ndarray, count: int) -> np.ndarray:
+        """The first `count` of `hits` in sort order.
+
+        Rank and position fold into one int64 key per hit (at most three
+        sort keys keep it far from overflow), so argpartition picks the
+        rows and only those are sorted.
+        """
+        if not sort:
+            return hits[:count]
+        base = len(self) + 1
+        keys = np.zeros(len(hits), dtype=np.int64)
+        for key in sort:
+            keys = keys * base + self.ranks[(key.column, key.descending)][hits]
+        keys = keys * base + hits
+        if count < len(hits):
+            selected = np.argpartition(keys, count - 1)[:count]
+        else:
+            selected = np.arange(len(hits))
+        return hits[selected[np.argsort(keys[selected])]]
+
+
+class ScreenerEngine:
+    """In-process screener over the latest snapshot, for deployments that
+    enable `in_memory_screener`.
+
+    A reload builds a complete new ScreenerUniverse and then replaces the
+    reference in one assignment; a request reads the reference once, so it
+    sees either the old universe or the new one, never a mix.
+    """
+
+    def __init__(self):
+        self._universe: Optional[ScreenerUniverse] = None
+        self._stale = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self._universe is not None
+
+    async def load(self) -> ScreenerUniverse:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(IndicatorSnapshot))
+            universe = ScreenerUniverse(result.scalars().all())
+        self._universe = universe
+        logger.info(f"Loaded {len(universe)} companies into the screener engine")
+        return universe
+
+    def invalidate(self, event: Optional[Dict] = None):
+        self._stale.set()
+
+    async def run(self):
+        """Load now, then reload after invalidations until cancelled. Until
+        the first load succeeds `ready` is False and screening stays on SQL."""
+        while True:
+            self._stale.clear()
+            try:
+                await self.load()
+            except (SQLAlchemyError, OSError) as e:
+                logger.warning(f"Screener engine load failed, retrying: {e}")
+                await asyncio.sleep(RELOAD_RETRY_DELAY)
+                continue
+            await self._stale.wait()
+            await asyncio.sleep(RELOAD_DELAY)
+
+    def screen(
+        self, filters: ScreenerFilter, skip: int = 0, limit: int = 50, cursor: Optional[str] = None
+    ) -> ScreenerResult:
+        universe = self._universe
+        sort = filters.sort or []
+        mask = universe.mask(filters)
+        total = int(mask.sum())
+        if cursor is not None:
+            values, after = decode_sort_cursor(cursor, sort)
+            mask &= universe.after(sort, values, after)
+            skip = 0
+        ordered = universe.top(sort, np.flatnonzero(mask), skip + limit + 1)
+        page = ordered[skip:skip + limit]
+        next_cursor = None
+        if len(ordered) > skip + limit:
+            last = page[-1]
+            next_cursor = sort_cursor(
+                sort, [universe.values[key.column][last] for key in sort], str(universe.stock_codes[last])
+            )
+        return ScreenerResult(
+            total=total,
+            companies=[universe.details[i] for i in page],
+            next_cursor=next_cursor
+        )
+
+
+screener_engine = ScreenerEngine()
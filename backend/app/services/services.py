@@ -1,31 +1,223 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_, or_, func
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple, get_args
+from collections import OrderedDict
+from bisect import bisect_left
 from decimal import Decimal
-from datetime import date
+from datetime import date, datetime
+import base64
+import json
+import numpy as np
 
-from app.models.models import Company, FinancialReport, StockPrice, Indicator, TrendAnalysis
+from app.models.models import (
+    Company, FinancialReport, StockPrice, Indicator, TrendAnalysis, IndicatorSnapshot, IndustryIndicatorStat
+)
 from app.models.schemas import (
     CompanyResponse, CompanyDetail, FinancialReportResponse,
-    StockPriceResponse, IndicatorResponse, ScreenerFilter,
-    ScreenerResult, TrendAnalysisResponse
+    StockPriceResponse, IndicatorResponse, ScreenerFilter, SortKey, SortColumn, PercentileColumn,
+    ScreenerResult, TrendAnalysisResponse, TrendBandPoint, TrendHistoryResponse,
+    IndustryBenchmarkResponse
 )
+from app.services.cache import response_cache
+
+TREND_WINDOW = 1278
+TREND_MIN_POINTS = 252
+TREND_HISTORY_CACHE_SIZE = 512
+
+# Bits of indicators.landmine_flags, as written by the crawler's tasks.landmine
+LANDMINE_FLAGS = {"debt_servicing": 1, "goodwill": 2, "cash": 4, "leverage": 8, "short_debt": 16}
+ALL_LANDMINES = sum(LANDMINE_FLAGS.values())
+
+# ScreenerFilter bounds -> (snapshot column, "min" | "max"), and the list
+# filters matched against the snapshot column of the same name. Shared by
+# the SQL path and the in-memory engine so both apply the same rules.
+SCREENER_RANGES = {
+    "roe_min": ("roe", "min"),
+    "roe_max": ("roe", "max"),
+    "pe_min": ("pe_ttm", "min"),
+    "pe_max": ("pe_ttm", "max"),
+    "pb_min": ("pb_ratio", "min"),
+    "pb_max": ("pb_ratio", "max"),
+    "current_ratio_min": ("current_ratio", "min"),
+    "f_score_min": ("f_score", "min"),
+    "cbs_score_min": ("cbs_score", "min"),
+}
+SCREENER_MEMBERSHIPS = ["signal", "industry", "market"]
+PERCENTILE_COLUMNS = list(get_args(PercentileColumn))
+
+_EPOCH = date(1970, 1, 1)
+# (company_id, window, as_of, row count, max updated_at) -> (dates, closes, bands);
+# bands rows are TL, +2SD, +1SD, -1SD, -2SD
+_trend_history_cache: "OrderedDict[Tuple[int, int, date, int, Optional[datetime]], tuple]" = OrderedDict()
+
+
+def rolling_trend_bands(days: np.ndarray, closes: np.ndarray, window: int, min_points: int = TREND_MIN_POINTS) -> np.ndarray:
+    """Band values at every index, each from the regression over the `window`
+    closes ending there (what the nightly job would have stored that day).
+
+    Windowed sums come from differences of cumulative sums, so the whole
+    series costs O(n) instead of one regression per day. x is shifted to
+    the series mean first to keep the cumulative sums well conditioned.
+    Indexes with fewer than `min_points` closes in their window are NaN.
+    """
+    x = days - days.mean() if len(days) else days
+    y = closes
+
+    def windowed(values: np.ndarray) -> np.ndarray:
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        end = np.arange(1, len(values) + 1)
+        return cumulative[end] - cumulative[np.maximum(end - window, 0)]
+
+    n = np.minimum(np.arange(1, len(y) + 1), window).astype(float)
+    sx, sy = windowed(x), windowed(y)
+    sxx = windowed(x * x) - sx * sx / n
+    sxy = windowed(x * y) - sx * sy / n
+    syy = windowed(y * y) - sy * sy / n
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        std_dev = np.sqrt(np.maximum(syy - slope * sxy, 0.0) / n)
+        trend_line = sy / n + slope * (x - sx / n)
+
+    valid = n >= min_points
+    trend_line = np.where(valid, trend_line, np.nan)
+    std_dev = np.where(valid, std_dev, np.nan)
+    return np.vstack([
+        trend_line,
+        trend_line + 2 * std_dev,
+        trend_line + std_dev,
+        trend_line - std_dev,
+        trend_line - 2 * std_dev,
+    ])
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(values: List) -> str:
+    """Opaque keyset position: the sort key values of the last row served."""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, size: int) -> List:
+    """Values of a cursor from encode_cursor: strings or NULLs, ending in
+    the (never NULL) stock_code."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise InvalidCursor(cursor)
+    if (
+        not isinstance(values, list) or len(values) != size
+        or not all(v is None or isinstance(v, str) for v in values) or values[-1] is None
+    ):
+        raise InvalidCursor(cursor)
+    return values
+
+def sort_cursor(sort: List[SortKey], values: List, stock_code: str) -> str:
+    return encode_cursor([None if v is None else str(v) for v in values] + [stock_code])
+
+def decode_sort_cursor(cursor: str, sort: List[SortKey]) -> Tuple[List, str]:
+    """Typed sort key values and stock_code of the row a page continues after."""
+    *values, after = decode_cursor(cursor, len(sort) + 1)
+    try:
+        values = [
+            None if value is None else SORT_TYPES[key.column](value)
+            for key, value in zip(sort, values)
+        ]
+    except (ValueError, ArithmeticError):
+        raise InvalidCursor(cursor)
+    return values, after
+
+def range_filters(filters: ScreenerFilter) -> List[Tuple[str, str, Decimal]]:
+    """(snapshot column, "min" | "max", bound) for every bound that is set."""
+    bounds = []
+    for field, (column, bound) in SCREENER_RANGES.items():
+        value = getattr(filters, field)
+        if value is not None:
+            bounds.append((column, bound, value))
+    for percentile in filters.percentiles or []:
+        column = f"{percentile.column}_{percentile.scope}_pct"
+        if percentile.min is not None:
+            bounds.append((column, "min", percentile.min))
+        if percentile.max is not None:
+            bounds.append((column, "max", percentile.max))
+    return bounds
+
+def landmine_masks(filters: ScreenerFilter) -> Tuple[int, int]:
+    """Bits that must be clear and bits that must be set."""
+    exclude = sum(LANDMINE_FLAGS[name] for name in set(filters.exclude_landmines or []))
+    require = sum(LANDMINE_FLAGS[name] for name in set(filters.require_landmines or []))
+    return exclude, require
+
+def _filter_key(filters: ScreenerFilter) -> Dict:
+    # Equivalent filters share one cached total regardless of list order;
+    # the sort order never changes a total
+    key = {}
+    for name, value in filters.model_dump(exclude_none=True, exclude={"sort"}).items():
+        if isinstance(value, list):
+            if not value:
+                continue
+            value = sorted({json.dumps(v, sort_keys=True, default=str) for v in value})
+        key[name] = value
+    return key
+
+_COMPANY_FIELDS = list(CompanyResponse.model_fields)
+_INDICATOR_FIELDS = [name for name in IndicatorResponse.model_fields if name != "id"]
+_PRICE_FIELDS = [name for name in StockPriceResponse.model_fields if name not in ("id", "date")]
+# Decimal or int per sortable (and so every filterable) snapshot column,
+# to bind cursor values against their own column type
+SORT_TYPES = {
+    column: IndicatorSnapshot.__table__.c[column].type.python_type
+    for column in get_args(SortColumn)
+}
+
+def snapshot_detail(row: IndicatorSnapshot) -> CompanyDetail:
+    fields = {name: getattr(row, name) for name in _COMPANY_FIELDS if name != "id"}
+    price = None
+    if row.price_id is not None:
+        price = StockPriceResponse(
+            id=row.price_id, date=row.price_date,
+            **{name: getattr(row, name) for name in _PRICE_FIELDS}
+        )
+    return CompanyDetail(
+        id=row.company_id,
+        **fields,
+        latest_indicators=IndicatorResponse(
+            id=row.indicator_id,
+            **{name: getattr(row, name) for name in _INDICATOR_FIELDS}
+        ),
+        latest_price=price,
+        percentiles={name: getattr(row, name) for name in PERCENTILE_COLUMNS}
+    )
 
 class CompanyService:
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def get_all(self, skip: int = 0, limit: int = 50) -> tuple[List[Company], int]:
-        result = await self.db.execute(
-            select(Company).order_by(Company.stock_code).offset(skip).limit(limit)
-        )
+    async def get_all(
+        self, skip: int = 0, limit: int = 50, cursor: Optional[str] = None
+    ) -> Tuple[List[Company], int, Optional[str]]:
+        """A page of companies by stock_code. With a cursor the page starts
+        right after the last row served (an index seek); `skip` is only
+        used without one."""
+        query = select(Company).order_by(Company.stock_code)
+        if cursor is not None:
+            (after,) = decode_cursor(cursor, 1)
+            query = query.where(Company.stock_code > after)
+        else:
+            query = query.offset(skip)
+        # One extra row tells whether another page exists
+        result = await self.db.execute(query.limit(limit + 1))
         companies = result.scalars().all()
+        next_cursor = encode_cursor([companies[limit - 1].stock_code]) if len(companies) > limit else None
+        
+        async def count() -> int:
+            count_result = await self.db.execute(select(func.count(Company.id)))
+            return count_result.scalar()
         
-        count_result = await self.db.execute(select(func.count(Company.id)))
-        total = count_result.scalar()
+        total = await response_cache.cached_total("companies", {}, count)
         
-        return companies, total
+        return companies[:limit], total, next_cursor
     
     async def get_by_code(self, stock_code: str) -> Optional[Company]:
         result = await self.db.execute(
@@ -71,68 +263,77 @@ class ScreenerService:
     def __init__(self, db: AsyncSession):
         self.db = db
     
-    async def screen(self, filters: ScreenerFilter, skip: int = 0, limit: int = 50) -> ScreenerResult:
-        subquery = (
-            select(
-                Indicator.company_id,
-                func.max(Indicator.report_date).label("max_date")
-            )
-            .group_by(Indicator.company_id)
-            .subquery()
-        )
+    async def screen(
+        self, filters: ScreenerFilter, skip: int = 0, limit: int = 50, cursor: Optional[str] = None
+    ) -> ScreenerResult:
+        # One precomputed row per company, so filters hit plain indexes
+        snapshot = IndicatorSnapshot
+        conditions = []
         
-        query = (
-            select(Company, Indicator)
-            .join(Indicator, Company.id == Indicator.company_id)
-            .join(
-                subquery,
-                and_(
-                    Indicator.company_id == subquery.c.company_id,
-                    Indicator.report_date == subquery.c.max_date
-                )
-            )
-        )
+        for column, bound, value in range_filters(filters):
+            attr = getattr(snapshot, column)
+            conditions.append(attr >= value if bound == "min" else attr <= value)
+        for field in SCREENER_MEMBERSHIPS:
+            values = getattr(filters, field)
+            if values:
+                conditions.append(getattr(snapshot, field).in_(values))
+        exclude, require = landmine_masks(filters)
+        if exclude:
+            # "No landmines at all" matches the partial index on landmine_flags = 0
+            if exclude == ALL_LANDMINES:
+                conditions.append(snapshot.landmine_flags == 0)
+            else:
+                conditions.append(snapshot.landmine_flags.op("&")(exclude) == 0)
+        if require:
+            conditions.append(snapshot.landmine_flags.op("&")(require) == require)
         
-        if filters.roe_min is not None:
-            query = query.where(Indicator.roe >= filters.roe_min)
-        if filters.roe_max is not None:
-            query = query.where(Indicator.roe <= filters.roe_max)
-        if filters.pe_min is not None:
-            query = query.where(Indicator.pe_ttm >= filters.pe_min)
-        if filters.pe_max is not None:
-            query = query.where(Indicator.pe_ttm <= filters.pe_max)
-        if filters.pb_min is not None:
-            query = query.where(Indicator.pb_ratio >= filters.pb_min)
-        if filters.pb_max is not None:
-            query = query.where(Indicator.pb_ratio <= filters.pb_max)
-        if filters.current_ratio_min is not None:
-            query = query.where(Indicator.current_ratio >= filters.current_ratio_min)
-        if filters.f_score_min is not None:
-            query = query.where(Indicator.f_score >= filters.f_score_min)
-        if filters.cbs_score_min is not None:
-            query = query.where(Indicator.cbs_score >= filters.cbs_score_min)
-        if filters.signal:
-            query = query.where(Indicator.signal.in_(filters.signal))
-        if filters.industry:
-            query = query.where(Company.industry.in_(filters.industry))
-        if filters.market:
-            query = query.where(Company.market.in_(filters.market))
-        
-        count_query = select(func.count()).select_from(query.subquery())
-        total_result = await self.db.execute(count_query)
-        total = total_result.scalar()
+        async def count() -> int:
+            total_result = await self.db.execute(select(func.count()).select_from(snapshot).where(*conditions))
+            return total_result.scalar()
         
-        result = await self.db.execute(query.offset(skip).limit(limit))
-        rows = result.all()
+        total = await response_cache.cached_total("screener", _filter_key(filters), count)
         
-        companies = []
-        for company, indicator in rows:
-            companies.append(CompanyDetail(
-                **{c.name: getattr(company, c.name) for c in company.__table__.columns},
-                latest_indicators=IndicatorResponse.model_validate(indicator)
-            ))
+        sort = filters.sort or []
+        # Same shape as the composite snapshot indexes: NULLS LAST, then stock_code.
+        # Keys without an index are a plain sort of the (one row per company) snapshot
+        order = [
+            getattr(snapshot, key.column).desc().nullslast() if key.descending
+            else getattr(snapshot, key.column).asc().nullslast()
+            for key in sort
+        ]
+        query = select(snapshot).where(*conditions).order_by(*order, snapshot.stock_code)
+        if cursor is not None:
+            values, after = decode_sort_cursor(cursor, sort)
+            query = query.where(self._after(sort, values, after))
+        else:
+            query = query.offset(skip)
+        result = await self.db.execute(query.limit(limit + 1))
+        rows = result.scalars().all()
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = sort_cursor(sort, [getattr(last, key.column) for key in sort], last.stock_code)
+        companies = [snapshot_detail(row) for row in rows[:limit]]
         
-        return ScreenerResult(total=total, companies=companies)
+        return ScreenerResult(total=total, companies=companies, next_cursor=next_cursor)
+    
+    @staticmethod
+    def _after(sort: List[SortKey], values: List, after: str):
+        """Rows that come after (values, after) in the sort order. Each key
+        either moves strictly past its value (or into the NULLs, which sort
+        last) or ties and defers to the next key; stock_code decides last."""
+        snapshot = IndicatorSnapshot
+        clauses, ties = [], []
+        for key, value in zip(sort, values):
+            attr = getattr(snapshot, key.column)
+            if value is None:
+                ties.append(attr.is_(None))
+                continue
+            past = attr < value if key.descending else attr > value
+            clauses.append(and_(*ties, or_(past, attr.is_(None))))
+            ties.append(attr == value)
+        clauses.append(and_(*ties, snapshot.stock_code > after))
+        return or_(*clauses)
 
 class FinancialReportService:
     def __init__(self, db: AsyncSession):
@@ -171,3 +372,105 @@ class TrendAnalysisService:
         )
         trend = result.scalar_one_or_none()
         return TrendAnalysisResponse.model_validate(trend) if trend else None
+    
+    async def get_history(
+        self, company_id: int,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        window: int = TREND_WINDOW
+    ) -> TrendHistoryResponse:
+        # Row count and newest updated_at version the cached bands, so a
+        # backfill or corrected close up to as_of misses the cache
+        as_of_query = select(
+            func.max(StockPrice.date), func.count(StockPrice.close), func.max(StockPrice.updated_at)
+        ).where(StockPrice.company_id == company_id)
+        if end:
+            as_of_query = as_of_query.where(StockPrice.date <= end)
+        as_of, count, updated_at = (await self.db.execute(as_of_query)).one()
+        if as_of is None:
+            return TrendHistoryResponse(company_id=company_id, window=window, as_of=None, points=[])
+        
+        key = (company_id, window, as_of, count, updated_at)
+        cached = _trend_history_cache.get(key)
+        if cached is None:
+            result = await self.db.execute(
+                select(StockPrice.date, StockPrice.close)
+                .where(
+                    StockPrice.company_id == company_id,
+                    StockPrice.date <= as_of,
+                    StockPrice.close.isnot(None)
+                )
+                .order_by(StockPrice.date)
+            )
+            rows = result.all()
+            dates = [row[0] for row in rows]
+            closes = np.array([float(row[1]) for row in rows])
+            days = np.array([(d - _EPOCH).days for d in dates], dtype=float)
+            cached = (dates, closes, rolling_trend_bands(days, closes, window))
+            _trend_history_cache[key] = cached
+            if len(_trend_history_cache) > TREND_HISTORY_CACHE_SIZE:
+                _trend_history_cache.popitem(last=False)
+        else:
+            _trend_history_cache.move_to_end(key)
+        
+        dates, closes, bands = cached
+        if start:
+            first = bisect_left(dates, start)
+        else:
+            first = max(len(dates) - window, 0)
+        
+        def value(v: float) -> Optional[float]:
+            return None if np.isnan(v) else round(float(v), 4)
+        
+        points = [
+            TrendBandPoint(
+                date=dates[i],
+                close=float(closes[i]),
+                trend_line=value(bands[0, i]),
+                sd_plus_2=value(bands[1, i]),
+                sd_plus_1=value(bands[2, i]),
+                sd_minus_1=value(bands[3, i]),
+                sd_minus_2=value(bands[4, i])
+            )
+            for i in range(first, len(dates))
+        ]
+        return TrendHistoryResponse(company_id=company_id, window=window, as_of=as_of, points=points)
+
+class IndustryService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_benchmarks(
+        self, industry: str,
+        year: Optional[int] = None,
+        season: Optional[int] = None
+    ) -> IndustryBenchmarkResponse:
+        """Precomputed distribution of each indicator for one industry and
+        quarter (default: the latest quarter with stats)."""
+        if year is None or season is None:
+            latest = await self.db.execute(
+                select(IndustryIndicatorStat.year, IndustryIndicatorStat.season)
+                .where(IndustryIndicatorStat.industry == industry)
+                .order_by(IndustryIndicatorStat.year.desc(), IndustryIndicatorStat.season.desc())
+                .limit(1)
+            )
+            row = latest.first()
+            if row is None:
+                return IndustryBenchmarkResponse(industry=industry, year=None, season=None, indicators=[])
+            year, season = row
+        
+        result = await self.db.execute(
+            select(IndustryIndicatorStat)
+            .where(
+                IndustryIndicatorStat.industry == industry,
+                IndustryIndicatorStat.year == year,
+                IndustryIndicatorStat.season == season
+            )
+            .order_by(IndustryIndicatorStat.indicator)
+        )
+        return IndustryBenchmarkResponse(
+            industry=industry,
+            year=year,
+            season=season,
+            indicators=result.scalars().all()
+        )
@@ -0,0 +1,229 @@
+"""The in-memory ScreenerEngine must return exactly what ScreenerService
+returns for the same snapshot rows: the same matches, the same order
+(NULLs and ties included), the same offset pages and the same cursor
+pages, with cursors interchangeable between the two paths.
+
+Run from the backend directory:
+
+    python -m pytest tests
+"""
+import asyncio
+import random
+from datetime import date
+from decimal import Decimal
+from typing import get_args
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.models.models import IndicatorSnapshot
+from app.models.schemas import PercentileColumn, RankColumn, ScreenerFilter, SortColumn
+from app.services import screener_engine
+from app.services.cache import response_cache
+from app.services.services import SORT_TYPES, ScreenerService
+
+NUMERIC = list(SORT_TYPES)
+SORTABLE = list(get_args(SortColumn))
+
+# Named cases for the orders the two paths are most likely to disagree on
+CASES = {
+    "default order": ScreenerFilter(),
+    "nulls last descending": ScreenerFilter(sort=[{"column": "roe", "descending": True}]),
+    "nulls last ascending": ScreenerFilter(sort=[{"column": "pe_ttm"}]),
+    "ties on every key": ScreenerFilter(
+        sort=[{"column": "f_score", "descending": True}, {"column": "cbs_score"}]
+    ),
+    "three keys": ScreenerFilter(
+        sort=[{"column": "cbs_score"}, {"column": "dividend_yield", "descending": True}, {"column": "f_score"}]
+    ),
+    "percentile sort": ScreenerFilter(sort=[{"column": "roe_industry_pct", "descending": True}]),
+    "unindexed keys": ScreenerFilter(sort=[
+        {"column": "gross_margin_industry_pct", "descending": True}, {"column": "cash_conversion_cycle"},
+        {"column": "pe_ttm", "descending": True}
+    ]),
+    "filters": ScreenerFilter(
+        roe_min=Decimal("0"), pe_max=Decimal("1.5"), industry=["a", "b"], signal=["BUY"],
+        exclude_landmines=["cash", "goodwill"], sort=[{"column": "roe"}]
+    ),
+    "no landmines": ScreenerFilter(
+        exclude_landmines=["debt_servicing", "goodwill", "cash", "leverage", "short_debt"],
+        sort=[{"column": "f_score", "descending": True}]
+    ),
+    "required landmines": ScreenerFilter(require_landmines=["leverage"], sort=[{"column": "pb_ratio"}]),
+    "percentile filter": ScreenerFilter(
+        percentiles=[{"column": "roe", "scope": "industry", "min": 50}, {"column": "pe_ttm", "scope": "market", "max": 80}],
+        sort=[{"column": "roe_market_pct", "descending": True}]
+    ),
+    "no matches": ScreenerFilter(roe_min=Decimal("1000")),
+}
+
+
+def _value(rng, column):
+    if rng.random() < 0.15:
+        return None
+    if SORT_TYPES[column] is int:
+        return rng.randint(0, 9)
+    if column.endswith("_pct"):
+        # Coarse enough that percentiles tie too
+        return Decimal(rng.randint(0, 20) * 5)
+    return Decimal(rng.randint(-300, 300)) / rng.choice([1, 10, 100])
+
+
+def _rows():
+    rng = random.Random(7)
+    codes = sorted(rng.sample(range(1000, 10000), 600))
+    rows = []
+    for company_id, code in enumerate(codes):
+        row = IndicatorSnapshot(
+            company_id=company_id, stock_code=f"{code}{rng.choice(['', 'A'])}", name=str(code),
+            industry=rng.choice([None, "a", "b", "c"]), market=rng.choice(["上市", "上櫃"]),
+            signal=rng.choice([None, "BUY", "SELL"]), landmine_flags=rng.choice([0, rng.randint(0, 31)]),
+            indicator_id=company_id, report_date=date(2024, 3, 31), year=2024, season=1
+        )
+        for column in NUMERIC:
+            setattr(row, column, _value(rng, column))
+        rows.append(row)
+    return rows
+
+
+def _random_filter(rng):
+    return ScreenerFilter(
+        roe_min=rng.choice([None, Decimal("-1.5"), Decimal("0")]),
+        f_score_min=rng.choice([None, 4]),
+        industry=rng.choice([None, ["a"], ["b", "c"]]),
+        market=rng.choice([None, ["上櫃"]]),
+        exclude_landmines=rng.choice([None, ["cash"]]),
+        percentiles=rng.choice([None, [{
+            "column": rng.choice(get_args(RankColumn)), "scope": rng.choice(["market", "industry"]), "min": 50
+        }]]),
+        sort=[
+            {"column": rng.choice(SORTABLE), "descending": rng.choice([True, False])}
+            for _ in range(rng.randint(0, 3))
+        ]
+    )
+
+
+CASES.update((f"random {n}", _random_filter(random.Random(n))) for n in range(30))
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def paths(loop):
+    """(SQL screen, engine screen, universe) over the same rows in SQLite."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    Session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(IndicatorSnapshot.__table__.create)
+        async with Session() as session:
+            session.add_all(_rows())
+            await session.commit()
+
+    async def uncached_total(name, filters, count):
+        return await count()
+
+    with pytest.MonkeyPatch.context() as patch:
+        # No Redis here: totals are always counted
+        patch.setattr(response_cache, "cached_total", uncached_total)
+        patch.setattr(screener_engine, "AsyncSessionLocal", Session)
+        loop.run_until_complete(setup())
+        engine_path = screener_engine.ScreenerEngine()
+        universe = loop.run_until_complete(engine_path.load())
+
+        def sql(*args, **kwargs):
+            async def screen():
+                async with Session() as session:
+                    return await ScreenerService(session).screen(*args, **kwargs)
+            return loop.run_until_complete(screen())
+
+        yield sql, engine_path.screen, universe
+    loop.run_until_complete(engine.dispose())
+
+
+def _codes(result):
+    return [company.stock_code for company in result.companies]
+
+
+def _offset_pages(screen, filters, limit, total):
+    codes = []
+    for skip in range(0, total + limit, limit):
+        codes += _codes(screen(filters, skip=skip, limit=limit))
+    return codes
+
+
+def _cursor_pages(screen, filters, limit):
+    codes, cursor = [], None
+    while True:
+        result = screen(filters, limit=limit, cursor=cursor)
+        codes += _codes(result)
+        cursor = result.next_cursor
+        if cursor is None:
+            return codes
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_mask_matches_sql(paths, name):
+    sql, _, universe = paths
+    filters = CASES[name]
+    everything = sql(filters, limit=len(universe) + 1)
+    matched = set(universe.stock_codes[universe.mask(filters)])
+    assert matched == set(_codes(everything))
+    assert everything.total == len(matched)
+
+
+@pytest.mark.parametrize("name", list(CASES))
+@pytest.mark.parametrize("limit", [7, 60])
+def test_pages_match_sql(paths, name, limit):
+    sql, engine, universe = paths
+    filters = CASES[name]
+    ordered = _codes(sql(filters, limit=len(universe) + 1))
+    assert len(set(ordered)) == len(ordered)
+    assert engine(filters, limit=len(universe) + 1).total == len(ordered)
+    assert _offset_pages(engine, filters, limit, len(ordered)) == ordered
+    assert _offset_pages(sql, filters, limit, len(ordered)) == ordered
+    assert _cursor_pages(engine, filters, limit) == ordered
+    assert _cursor_pages(sql, filters, limit) == ordered
+
+
+@pytest.mark.parametrize("column", SORTABLE)
+@pytest.mark.parametrize("descending", [False, True])
+def test_every_sort_key_matches_sql(paths, column, descending):
+    sql, engine, universe = paths
+    filters = ScreenerFilter(sort=[{"column": column, "descending": descending}])
+    ordered = _codes(sql(filters, limit=len(universe) + 1))
+    assert len(ordered) == len(universe)
+    assert _codes(engine(filters, limit=len(universe) + 1)) == ordered
+    assert _cursor_pages(engine, filters, 60) == ordered
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_cursors_are_interchangeable(paths, name):
+    sql, engine, _ = paths
+    filters = CASES[name]
+    from_engine = engine(filters, limit=7)
+    from_sql = sql(filters, limit=7)
+    assert from_engine.next_cursor == from_sql.next_cursor
+    if from_engine.next_cursor is not None:
+        assert _codes(sql(filters, limit=7, cursor=from_engine.next_cursor)) == _codes(
+            engine(filters, limit=7, cursor=from_sql.next_cursor)
+        )
+
+
+def test_every_numeric_column_is_sortable():
+    assert set(SORTABLE) == set(NUMERIC)
+    assert set(get_args(PercentileColumn)) <= set(SORTABLE)
+
+
+def test_cases_cover_nulls_and_ties(paths):
+    _, _, universe = paths
+    roe = universe.numeric["roe"]
+    assert (roe != roe).any()
+    assert len(set(universe.values["f_score"])) < len(universe) // 10
@@ -0,0 +1,77 @@
+"""Statements/sec of the BeautifulSoup reference parser vs the lxml parser.
+
+Pages come from the crawler response cache (every captured MOPS t164sb0x
+answer) or from a directory of `<balance|income|cashflow>_*.html` files:
+
+    python -m benchmarks.mops_parser
+    python -m benchmarks.mops_parser --pages ./captured --repeat 5
+
+Both parsers must return the same dict for every page, mismatches are listed.
+"""
+import argparse
+import os
+import time
+
+from tasks.cache import ResponseCache, CACHE_DIR
+from tasks.mops_parser import parse_financial_html, parse_financial_html_soup
+
+REPORT_TYPES = {
+    "ajax_t164sb01": "balance",
+    "ajax_t164sb04": "income",
+    "ajax_t164sb05": "cashflow",
+}
+
+
+def pages_from_cache(directory: str):
+    cache = ResponseCache(directory=directory, mode="replay")
+    for entry in cache.entries():
+        url = entry["request"]["url"]
+        for endpoint, report_type in REPORT_TYPES.items():
+            if url.endswith(endpoint):
+                yield report_type, entry["content"].decode("utf-8", errors="replace")
+
+
+def pages_from_directory(directory: str):
+    for name in sorted(os.listdir(directory)):
+        report_type = name.split("_", 1)[0]
+        if report_type in REPORT_TYPES.values() and name.endswith(".html"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                yield report_type, f.read()
+
+
+def measure(parser, pages, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for report_type, html in pages:
+            parser(html, report_type)
+    return len(pages) * repeat / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", help="directory of captured pages instead of the response cache")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = list(pages_from_directory(args.pages) if args.pages else pages_from_cache(args.cache_dir))
+    if not pages:
+        raise SystemExit("No captured MOPS pages found")
+
+    mismatches = [
+        i for i, (report_type, html) in enumerate(pages)
+        if parse_financial_html(html, report_type) != parse_financial_html_soup(html, report_type)
+    ]
+
+    soup_rate = measure(parse_financial_html_soup, pages, args.repeat)
+    lxml_rate = measure(parse_financial_html, pages, args.repeat)
+
+    print(f"{len(pages)} pages x {args.repeat}")
+    print(f"bs4/html.parser {soup_rate:>10,.0f} statements/s")
+    print(f"lxml compiled   {lxml_rate:>10,.0f} statements/s  ({lxml_rate / soup_rate:.1f}x)")
+    if mismatches:
+        print(f"{len(mismatches)} pages parse differently, first: #{mismatches[0]}")
+
+
+if __name__ == "__main__":
+    main()
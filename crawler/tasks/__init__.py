@@ -8,7 +8,7 @@ app = Celery(
     "tasks",
     broker=REDIS_URL,
     backend=REDIS_URL,
-    include=["tasks.stock_list", "tasks.stock_price", "tasks.financial_report", "tasks.indicators"]
+    include=["tasks.stock_list", "tasks.stock_price", "tasks.financial_report", "tasks.indicators", "tasks.valuation", "tasks.industry"]
 )
 
 app.conf.update(
@@ -21,7 +21,9 @@ app.conf.update(
     task_time_limit=3600,
     task_soft_time_limit=3300,
     worker_prefetch_multiplier=1,
-    worker_max_tasks_per_child=50,
+    # Chunked indicator runs send a handful of large tasks; recycling every
+    # few tasks would throw away warm imports and connection pools
+    worker_max_tasks_per_child=int(os.getenv("WORKER_MAX_TASKS_PER_CHILD", "1000")),
 )
 
 app.conf.beat_schedule = {
@@ -33,13 +35,23 @@ app.conf.beat_schedule = {
         "task": "tasks.financial_report.fetch_all_reports",
         "schedule": crontab(day_of_week=6, hour=2, minute=0),
     },
+    "update-industries": {
+        "task": "tasks.industry.update_industries",
+        "schedule": crontab(day_of_week=6, hour=1, minute=0),
+    },
     "calculate-indicators": {
         "task": "tasks.indicators.calculate_all",
         "schedule": crontab(hour=3, minute=0),
     },
-    "update-trend-analysis": {
+    "refit-trend-analysis": {
         "task": "tasks.indicators.update_trend_analysis",
-        "schedule": crontab(hour=4, minute=0),
+        "schedule": crontab(day_of_week=0, hour=4, minute=0),
+        "kwargs": {"force_full": True, "refit": True},
+    },
+    "rebuild-indicators": {
+        "task": "tasks.indicators.calculate_all",
+        "schedule": crontab(day_of_week=0, hour=5, minute=0),
+        "kwargs": {"force_full": True, "chunked": True},
     },
 }
 
@@ -0,0 +1,107 @@
+import csv
+import io
+from typing import Iterable, List, Optional, Sequence
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "50000"))
+
+COPY_NULL = "\\N"
+
+
+def _copy_value(value):
+    if value is None:
+        return COPY_NULL
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def _batches(rows: Iterable[Sequence], batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_upsert(
+    conn,
+    table: str,
+    columns: List[str],
+    rows: Iterable[Sequence],
+    conflict_columns: List[str],
+    update_columns: Optional[List[str]] = None,
+    coalesce: bool = False,
+    skip_unchanged: bool = False,
+    batch_size: int = BULK_BATCH_SIZE
+) -> int:
+    """Upsert `rows` (tuples ordered like `columns`) into `table`.
+
+    Each batch is streamed with COPY into a temp staging table and merged with
+    a single INSERT ... SELECT ... ON CONFLICT DO UPDATE. With `coalesce=True`
+    a NULL in the incoming row keeps the stored value instead of clearing it.
+    With `skip_unchanged=True` rows whose values would not change are left
+    alone, so their updated_at (and anything watching it) is not bumped.
+    Runs inside the caller's transaction.
+    """
+    if update_columns is None:
+        update_columns = [c for c in columns if c not in conflict_columns]
+
+    stage = f"_stage_{table}"
+    column_list = ", ".join(columns)
+    conflict_list = ", ".join(conflict_columns)
+
+    if update_columns:
+        if coalesce:
+            incoming = [f"COALESCE(EXCLUDED.{c}, {table}.{c})" for c in update_columns]
+        else:
+            incoming = [f"EXCLUDED.{c}" for c in update_columns]
+        assignments = [f"{c} = {value}" for c, value in zip(update_columns, incoming)]
+        on_conflict = f"DO UPDATE SET {', '.join(assignments)}"
+        if skip_unchanged:
+            stored = ", ".join(f"{table}.{c}" for c in update_columns)
+            on_conflict += f" WHERE ({stored}) IS DISTINCT FROM ({', '.join(incoming)})"
+    else:
+        on_conflict = "DO NOTHING"
+
+    # DISTINCT ON keeps the last staged row per key, ON CONFLICT cannot touch a row twice
+    merge_sql = f"""
+        INSERT INTO {table} ({column_list})
+        SELECT DISTINCT ON ({conflict_list}) {column_list}
+        FROM {stage}
+        ORDER BY {conflict_list}, ctid DESC
+        ON CONFLICT ({conflict_list}) {on_conflict}
+    """
+
+    cursor = conn.connection.cursor()
+    total = 0
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {stage} ON COMMIT DROP AS "
+            f"SELECT {column_list} FROM {table} WITH NO DATA"
+        )
+        for batch in _batches(rows, batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([_copy_value(v) for v in row])
+            buffer.seek(0)
+
+            cursor.execute(f"TRUNCATE {stage}")
+            cursor.copy_expert(
+                f"COPY {stage} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer
+            )
+            cursor.execute(merge_sql)
+            total += cursor.rowcount
+    finally:
+        cursor.close()
+
+    logger.debug(f"Bulk upserted {total} rows into {table}")
+    return total
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import time
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("CRAWLER_CACHE_DIR", "/app/.cache/http")
+# "on": read-through cache, "off": always hit upstream, "replay": serve from cache only
+CACHE_MODE = os.getenv("CRAWLER_CACHE_MODE", "on")
+CACHE_MAX_BYTES = int(os.getenv("CRAWLER_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+OPEN_PERIOD_TTL = 30 * 60
+CLOSED_PERIOD_TTL = 180 * 24 * 3600
+
+EVICT_EVERY_PUTS = 200
+
+
+class CacheMiss(Exception):
+    pass
+
+
+def period_ttl(period_end: date, settle_days: int = 0) -> int:
+    """Long TTL once a period can no longer change upstream, short TTL while it is open."""
+    if date.today() > period_end + timedelta(days=settle_days):
+        return CLOSED_PERIOD_TTL
+    return OPEN_PERIOD_TTL
+
+
+def cache_key(method: str, url: str, params: Optional[Dict] = None, data: Optional[Dict] = None) -> str:
+    canonical = json.dumps(
+        [method.upper(), url, sorted((params or {}).items()), sorted((data or {}).items())],
+        ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed on-disk store of upstream responses.
+
+    Each entry is one file: a JSON header line (request, status, expiry)
+    followed by the raw body. Reads refresh the file mtime, so size-based
+    eviction drops the least recently used entries first.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES, mode: str = CACHE_MODE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._puts = 0
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[Dict]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+
+        if not self.replay and meta["expires_at"] < time.time():
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return {**meta, "content": content}
+
+    def put(self, key: str, request: Dict, status_code: int, content_type: Optional[str], content: bytes, ttl: int):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta = {
+            "request": request,
+            "status_code": status_code,
+            "content_type": content_type,
+            "stored_at": time.time(),
+            "expires_at": time.time() + ttl,
+        }
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(meta, ensure_ascii=False, default=str).encode("utf-8") + b"\n")
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        self._puts += 1
+        if self._puts % EVICT_EVERY_PUTS == 0:
+            self.evict()
+
+    def entries(self) -> Iterator[Dict]:
+        if not os.path.isdir(self.directory):
+            return
+        for shard in sorted(os.listdir(self.directory)):
+            shard_dir = os.path.join(self.directory, shard)
+            for name in sorted(os.listdir(shard_dir)):
+                if name.endswith(".tmp"):
+                    continue
+                entry = self.get(name)
+                if entry:
+                    yield entry
+
+    def evict(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        logger.info(f"Evicted {removed} cached responses, cache now {total / 1024 ** 2:.0f} MiB")
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def get_cache() -> Optional[ResponseCache]:
+    global _default_cache
+    if CACHE_MODE == "off":
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
@@ -0,0 +1,171 @@
+import httpx
+import asyncio
+import random
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import os
+import logging
+
+from tasks.cache import CacheMiss, ResponseCache, cache_key, get_cache
+from tasks import runtime
+
+logger = logging.getLogger(__name__)
+
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", "3"))
+FETCH_BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", "1.0"))
+
+# (requests per second, burst) per upstream host; the most specific suffix wins
+HOST_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "mops.twse.com.tw": (1.0, 2),
+    "twse.com.tw": (0.6, 3),
+    "tpex.org.tw": (2.0, 5),
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+_buckets: Dict[str, "TokenBucket"] = {}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _host_key(url: str) -> Optional[str]:
+    host = urlsplit(url).hostname or ""
+    for key in sorted(HOST_RATE_LIMITS, key=len, reverse=True):
+        if host == key or host.endswith("." + key):
+            return key
+    return None
+
+
+def _get_bucket(url: str) -> Optional[TokenBucket]:
+    # Buckets live as long as the worker process so the limit holds across tasks
+    key = _host_key(url)
+    if key is None:
+        return None
+    if key not in _buckets:
+        rate, burst = HOST_RATE_LIMITS[key]
+        _buckets[key] = TokenBucket(rate, burst)
+    return _buckets[key]
+
+
+class Fetcher:
+    """Shared HTTP engine for crawler tasks.
+
+    Bounds the number of requests in flight, throttles each upstream host with
+    a token bucket and retries transport errors / 429 / 5xx with full-jitter
+    exponential backoff. `get` and `post` mirror `httpx.AsyncClient`, so the
+    fetch helpers can take a Fetcher wherever they used to take a client.
+
+    Requests made with `cache_ttl=` go through the on-disk response cache;
+    in replay mode every request is served from the cache or raises CacheMiss.
+
+    Without an explicit `client`, requests go through the worker's pooled
+    per-host clients (tasks.runtime), which outlive the Fetcher.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = FETCH_CONCURRENCY,
+        max_retries: int = FETCH_MAX_RETRIES,
+        backoff_base: float = FETCH_BACKOFF_BASE,
+        timeout: float = 30,
+        client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[ResponseCache] = None
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.client = client
+        self.cache = cache if cache is not None else get_cache()
+
+    async def __aenter__(self) -> "Fetcher":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        cache_ttl: Optional[int] = None,
+        cache_when: Optional[Callable[[httpx.Response], bool]] = None,
+        **kwargs
+    ) -> httpx.Response:
+        if self.cache is None or (cache_ttl is None and not self.cache.replay):
+            return await self._send(method, url, **kwargs)
+
+        key = cache_key(method, url, kwargs.get("params"), kwargs.get("data"))
+        cached = self.cache.get(key)
+        if cached:
+            return httpx.Response(
+                cached["status_code"],
+                headers={"content-type": cached["content_type"]} if cached["content_type"] else None,
+                content=cached["content"],
+                request=httpx.Request(method, url, params=kwargs.get("params"))
+            )
+        if self.cache.replay:
+            raise CacheMiss(f"{method} {url} is not in the response cache")
+
+        response = await self._send(method, url, **kwargs)
+        if response.status_code == 200 and cache_ttl and (cache_when is None or cache_when(response)):
+            self.cache.put(
+                key,
+                {"method": method, "url": url, "params": kwargs.get("params"), "data": kwargs.get("data")},
+                response.status_code,
+                response.headers.get("content-type"),
+                response.content,
+                cache_ttl
+            )
+        return response
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        bucket = _get_bucket(url)
+        client = self.client or runtime.get_client(url)
+        kwargs.setdefault("timeout", self.timeout)
+
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                if bucket:
+                    await bucket.acquire()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    if attempt >= self.max_retries:
+                        raise
+                    logger.warning(f"{method} {url} failed ({e!r}), retry {attempt + 1}/{self.max_retries}")
+                else:
+                    if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        return response
+                    logger.warning(f"{method} {url} returned {response.status_code}, retry {attempt + 1}/{self.max_retries}")
+
+            await asyncio.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
@@ -1,16 +1,20 @@
 import httpx
 import asyncio
 from datetime import datetime, date
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Set, Tuple
 from decimal import Decimal
 import sqlalchemy
 from sqlalchemy import text
 import os
 import logging
 import re
-from bs4 import BeautifulSoup
 
-from tasks import app
+from tasks import app, events
+from tasks.fetcher import Fetcher
+from tasks.runtime import run
+from tasks.bulk import bulk_upsert
+from tasks.cache import period_ttl
+from tasks.mops_parser import LABEL_MAPPINGS, parse_financial_html
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +26,22 @@ MOPS_BALANCE_SHEET = f"{MOPS_BASE_URL}/mops/web/t164sb01"
 MOPS_INCOME_STATEMENT = f"{MOPS_BASE_URL}/mops/web/t164sb04"
 MOPS_CASH_FLOW = f"{MOPS_BASE_URL}/mops/web/t164sb05"
 
+# 法定申報期限: Q1 5/15, Q2 8/14, Q3 11/14, 年報 (Q4) 隔年 3/31
+FILING_DEADLINES = {1: (5, 15), 2: (8, 14), 3: (11, 14), 4: (3, 31)}
+
+# financial_reports columns filled by each statement; a stored quarter with
+# every column of a statement NULL lost it to a failed fetch and is fetched
+# again, the coalescing upsert filling only what is missing
+STATEMENT_FIELDS = {
+    report_type: sorted(set(mapping.values())) for report_type, mapping in LABEL_MAPPINGS.items()
+}
+STORED_STATEMENTS_SQL = ", ".join(
+    f"num_nonnulls({', '.join(fields)}) > 0" for fields in STATEMENT_FIELDS.values()
+)
+
 
 async def fetch_financial_report_mops(
-    client: httpx.AsyncClient,
+    fetcher: Fetcher,
     stock_code: str,
     year: int,
     season: int,
@@ -52,7 +69,12 @@ async def fetch_financial_report_mops(
     }
     
     try:
-        response = await client.post(url, data=form_data, timeout=30)
+        # A late filer answers 查無資料 first, that must not be pinned in the cache
+        response = await fetcher.post(
+            url, data=form_data, timeout=30,
+            cache_ttl=period_ttl(filing_deadline(year, season)),
+            cache_when=lambda r: "hasBorder" in r.text
+        )
         if response.status_code == 200:
             return parse_financial_html(response.text, report_type)
     except Exception as e:
@@ -60,95 +82,89 @@ async def fetch_financial_report_mops(
     return None
 
 
-def parse_financial_html(html: str, report_type: str) -> Dict:
-    soup = BeautifulSoup(html, "html.parser")
-    result = {}
+def filing_deadline(year: int, season: int) -> date:
+    month, day = FILING_DEADLINES[season]
+    return date(year + 1 if season == 4 else year, month, day)
+
+
+def published_quarters(years: int, today: Optional[date] = None) -> List[Tuple[int, int]]:
+    today = today or date.today()
+    return [
+        (year, season)
+        for year in range(today.year - years, today.year + 1)
+        for season in (1, 2, 3, 4)
+        if filing_deadline(year, season) <= today
+    ][-years * 4:]
+
+
+def _upsert_reports(conn, company_id: int, reports: List[Dict]) -> int:
+    if not reports:
+        return 0
     
-    tables = soup.find_all("table", {"class": "hasBorder"})
-    if not tables:
-        return result
+    value_columns = []
+    for report in reports:
+        for key in report:
+            if key not in ["year", "season", "report_date"] and key not in value_columns:
+                value_columns.append(key)
+    columns = ["company_id", "report_date", "year", "season"] + value_columns
     
-    for table in tables:
-        rows = table.find_all("tr")
-        for row in rows:
-            cells = row.find_all("td")
-            if len(cells) >= 2:
-                label = cells[0].get_text(strip=True)
-                value_str = cells[1].get_text(strip=True) if len(cells) > 1 else ""
-                
-                key = _map_label_to_key(label, report_type)
-                if key:
-                    result[key] = _parse_value(value_str)
+    # A statement that failed to parse a field must not wipe what an earlier run stored
+    return bulk_upsert(
+        conn, "financial_reports", columns,
+        ([company_id] + [report.get(col) for col in columns[1:]] for report in reports),
+        conflict_columns=["company_id", "year", "season"],
+        update_columns=columns[1:2] + value_columns,
+        coalesce=True,
+        skip_unchanged=True
+    )
+
+
+async def fetch_quarter_report(fetcher: Fetcher, stock_code: str, year: int, season: int) -> Optional[Dict]:
+    balance, income, cashflow = await asyncio.gather(
+        fetch_financial_report_mops(fetcher, stock_code, year, season, "balance"),
+        fetch_financial_report_mops(fetcher, stock_code, year, season, "income"),
+        fetch_financial_report_mops(fetcher, stock_code, year, season, "cashflow")
+    )
     
-    return result
-
-
-def _map_label_to_key(label: str, report_type: str) -> Optional[str]:
-    mappings = {
-        "balance": {
-            "資產總計": "total_assets",
-            "負債總計": "total_liabilities",
-            "權益總額": "stockholders_equity",
-            "流動資產": "current_assets",
-            "流動負債": "current_liabilities",
-            "存貨": "inventory",
-            "應收帳款淨額": "accounts_receivable",
-            "應收帳款": "accounts_receivable",
-            "現金及約當現金": "cash_and_equivalents",
-            "商譽": "goodwill",
-            "短期借款": "short_term_debt",
-            "長期借款": "long_term_debt",
-            "不動產、廠房及設備": "fixed_assets",
-            "固定資產": "fixed_assets",
-        },
-        "income": {
-            "營業收入": "revenue",
-            "營業成本": "cost_of_goods_sold",
-            "營業毛利": "gross_profit",
-            "營業費用": "operating_expenses",
-            "營業利益": "operating_profit",
-            "營業外收入及支出": "non_operating_income",
-            "本期淨利": "net_income",
-            "本期綜合損益總額": "net_income",
-            "基本每股盈餘": "eps",
-        },
-        "cashflow": {
-            "營業活動之淨現金流入": "operating_cash_flow",
-            "營業活動之淨現金流量": "operating_cash_flow",
-            "投資活動之淨現金流入": "investing_cash_flow",
-            "投資活動之淨現金流量": "investing_cash_flow",
-            "籌資活動之淨現金流入": "financing_cash_flow",
-            "籌資活動之淨現金流量": "financing_cash_flow",
+    if balance or income or cashflow:
+        return {
+            "year": year,
+            "season": season,
+            "report_date": date(year, season * 3, 15),
+            **{k: v for d in [balance, income, cashflow] if d for k, v in d.items()}
         }
-    }
-    
-    mapping = mappings.get(report_type, {})
-    for key, value in mapping.items():
-        if key in label:
-            return value
     return None
 
 
-def _parse_value(s: str) -> Optional[int]:
-    if not s or s in ["-", "--", "N/A", ""]:
-        return None
-    try:
-        s = s.replace(",", "").replace(" ", "").replace("　", "").strip()
-        if s.startswith("(") and s.endswith(")"):
-            s = "-" + s[1:-1]
-        return int(float(s))
-    except:
-        return None
+def report_statements(report: Dict) -> Set[str]:
+    """Statements with at least one field in `report`, as STORED_STATEMENTS_SQL sees the stored row."""
+    return {
+        report_type for report_type, fields in STATEMENT_FIELDS.items()
+        if any(report.get(field) is not None for field in fields)
+    }
+
+
+def _stored_quarters(rows) -> Dict[Tuple[int, int], Set[str]]:
+    """(year, season) -> stored statements, from rows of year, season, STORED_STATEMENTS_SQL."""
+    return {
+        (year, season): {report_type for report_type, present in zip(STATEMENT_FIELDS, flags) if present}
+        for year, season, *flags in rows
+    }
+
+
+def _missing_quarters(stored: Dict[Tuple[int, int], Set[str]], years: int) -> List[Tuple[int, int]]:
+    """Published quarters not stored, or stored without one of the statements."""
+    return [
+        quarter for quarter in published_quarters(years)
+        if stored.get(quarter, set()) != set(STATEMENT_FIELDS)
+    ]
 
 
 @app.task(bind=True, max_retries=3)
-def fetch_company_reports(self, stock_code: str, years: int = 3):
+def fetch_company_reports(self, stock_code: str, years: int = 3, incremental: bool = True, quarters: Optional[List] = None):
     logger.info(f"Fetching financial reports for {stock_code}...")
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
         with engine.connect() as conn:
             result = conn.execute(
                 text("SELECT id FROM companies WHERE stock_code = :code"),
@@ -158,77 +174,73 @@ def fetch_company_reports(self, stock_code: str, years: int = 3):
             if not row:
                 return {"status": "error", "message": "Stock not found"}
             company_id = row[0]
+            
+            if quarters is not None:
+                targets = [tuple(q) for q in quarters]
+            elif incremental:
+                existing = conn.execute(
+                    text(f"SELECT year, season, {STORED_STATEMENTS_SQL} FROM financial_reports WHERE company_id = :company_id"),
+                    {"company_id": company_id}
+                ).fetchall()
+                targets = _missing_quarters(_stored_quarters(existing), years)
+            else:
+                targets = published_quarters(years)
         
-        current_year = date.today().year
-        seasons = [1, 2, 3, 4]
+        if not targets:
+            return {"status": "success", "count": 0}
         
         async def fetch_all():
-            async with httpx.AsyncClient(timeout=30) as client:
-                reports = []
-                for year_offset in range(years):
-                    year = current_year - year_offset
-                    for season in seasons:
-                        balance = await fetch_financial_report_mops(client, stock_code, year, season, "balance")
-                        income = await fetch_financial_report_mops(client, stock_code, year, season, "income")
-                        cashflow = await fetch_financial_report_mops(client, stock_code, year, season, "cashflow")
-                        
-                        if balance or income or cashflow:
-                            reports.append({
-                                "year": year,
-                                "season": season,
-                                "report_date": date(year, season * 3, 15),
-                                **{k: v for d in [balance, income, cashflow] if d for k, v in d.items()}
-                            })
-                        
-                        await asyncio.sleep(1)
-                return reports
+            async with Fetcher() as fetcher:
+                reports = await asyncio.gather(*(
+                    fetch_quarter_report(fetcher, stock_code, year, season)
+                    for year, season in targets
+                ))
+                return [report for report in reports if report]
         
-        reports = loop.run_until_complete(fetch_all())
+        reports = run(fetch_all())
         
         with engine.begin() as conn:
-            for report in reports:
-                columns = ["company_id", "report_date", "year", "season"] + \
-                         [k for k in report.keys() if k not in ["year", "season", "report_date"]]
-                values = [company_id, report["report_date"], report["year"], report["season"]] + \
-                        [report.get(k) for k in columns[4:]]
-                
-                placeholders = ", ".join([f":{i}" for i in range(len(columns))])
-                update_set = ", ".join([f"{col} = EXCLUDED.{col}" for col in columns[3:]])
-                
-                sql = f"""
-                    INSERT INTO financial_reports ({', '.join(columns)})
-                    VALUES ({placeholders})
-                    ON CONFLICT (company_id, year, season) DO UPDATE SET {update_set}
-                """
-                
-                conn.execute(text(sql), {str(i): v for i, v in enumerate(values)})
+            _upsert_reports(conn, company_id, reports)
         
-        logger.info(f"Updated {len(reports)} reports for {stock_code}")
-        return {"status": "success", "count": len(reports)}
+        if reports:
+            events.publish("company", [stock_code])
+        logger.info(f"Updated {len(reports)} of {len(targets)} requested reports for {stock_code}")
+        return {"status": "success", "count": len(reports), "requested": len(targets)}
         
     except Exception as e:
         logger.error(f"Error fetching reports for {stock_code}: {e}")
         self.retry(exc=e, countdown=300)
         return {"status": "error", "message": str(e)}
-    finally:
-        loop.close()
 
 
 @app.task(bind=True)
-def fetch_all_reports(self):
-    logger.info("Starting full financial report fetch...")
+def fetch_all_reports(self, years: int = 2, incremental: bool = True):
+    logger.info(f"Starting {'incremental' if incremental else 'full'} financial report fetch...")
     
     try:
         with engine.connect() as conn:
-            result = conn.execute(text("SELECT stock_code FROM companies LIMIT 50"))
-            stocks = [row[0] for row in result.fetchall()]
+            stocks = conn.execute(text("SELECT id, stock_code FROM companies WHERE delisted_date IS NULL ORDER BY stock_code")).fetchall()
+            existing: Dict[int, List] = {}
+            if incremental:
+                rows = conn.execute(
+                    text(f"SELECT company_id, year, season, {STORED_STATEMENTS_SQL} FROM financial_reports WHERE year >= :min_year"),
+                    {"min_year": date.today().year - years - 1}
+                ).fetchall()
+                for company_id, *row in rows:
+                    existing.setdefault(company_id, []).append(row)
         
-        success_count = 0
-        for stock_code in stocks:
-            task_result = fetch_company_reports.delay(stock_code, years=2)
-            success_count += 1
+        queued = 0
+        quarters = 0
+        for company_id, stock_code in stocks:
+            targets = _missing_quarters(_stored_quarters(existing.get(company_id, [])), years)
+            if not targets:
+                continue
+            fetch_company_reports.delay(stock_code, years=years, quarters=targets)
+            queued += 1
+            quarters += len(targets)
         
-        return {"status": "success", "queued": success_count}
+        logger.info(f"Queued {quarters} missing quarters across {queued} of {len(stocks)} companies")
+        return {"status": "success", "queued": queued, "quarters": quarters, "companies": len(stocks)}
         
     except Exception as e:
         logger.error(f"Error in fetch_all_reports: {e}")
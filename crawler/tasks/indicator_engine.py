@@ -0,0 +1,221 @@
+from typing import Dict, Iterator, List, Optional, Sequence
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from tasks.ttm import FLOW_FIELDS
+
+logger = logging.getLogger(__name__)
+
+REPORTS_PER_COMPANY = 8
+# Extra quarters loaded so the oldest emitted report still has its prior-year pair
+F_SCORE_LOOKBACK = 4
+
+# DECIMAL(8, 4) columns overflow past this; such ratios are stored as NULL
+NUMERIC_LIMIT = 10_000
+
+REPORT_FIELDS = [
+    "total_assets", "total_liabilities", "stockholders_equity",
+    "current_assets", "current_liabilities", "inventory", "accounts_receivable",
+    "cash_and_equivalents", "goodwill", "short_term_debt",
+    "revenue", "cost_of_goods_sold", "gross_profit", "operating_profit",
+    "net_income", "eps", "interest_expense", "operating_cash_flow",
+]
+
+RATIO_COLUMNS = [
+    "roe", "net_margin", "gross_margin", "operating_margin",
+    "asset_turnover", "equity_multiplier",
+    "current_ratio", "quick_ratio", "debt_ratio", "cash_ratio",
+    "goodwill_ratio", "pe_ttm", "interest_coverage", "short_debt_to_cash",
+]
+
+INTEGER_COLUMNS = ["inventory_turnover_days", "accounts_receivable_turnover_days", "f_score", "cbs_score"]
+
+
+def fetch_reports(conn, company_ids: Optional[Sequence[int]] = None, per_company: int = REPORTS_PER_COMPANY) -> List[Dict]:
+    """Latest reports per company plus the lookback needed for F-Score pairs,
+    each carrying the company's latest close, in one round trip.
+
+    Flow fields are the trailing twelve months from financial_ttm, so they
+    are NULL until four consecutive quarters are on file.
+    """
+    where = "WHERE company_id = ANY(:company_ids)" if company_ids is not None else ""
+    fields = [
+        f"t.{field}_ttm AS {field}" if field in FLOW_FIELDS else f"ranked.{field}"
+        for field in REPORT_FIELDS
+    ]
+    result = conn.execute(text(f"""
+        SELECT ranked.company_id, ranked.report_date, ranked.year, ranked.season,
+               {', '.join(fields)},
+               ranked.rn, p.close AS current_price
+        FROM (
+            SELECT fr.*, ROW_NUMBER() OVER (PARTITION BY company_id ORDER BY report_date DESC) AS rn
+            FROM financial_reports fr
+            {where}
+        ) ranked
+        LEFT JOIN financial_ttm t
+            ON t.company_id = ranked.company_id AND t.year = ranked.year AND t.season = ranked.season
+        LEFT JOIN LATERAL (
+            SELECT close FROM stock_prices
+            WHERE company_id = ranked.company_id
+            ORDER BY date DESC LIMIT 1
+        ) p ON TRUE
+        WHERE ranked.rn <= :limit
+        ORDER BY ranked.company_id, ranked.report_date DESC
+    """), {"company_ids": list(company_ids or []), "limit": per_company + F_SCORE_LOOKBACK})
+    return [dict(row._mapping) for row in result.fetchall()]
+
+
+def load_reports(conn, company_ids: Optional[Sequence[int]] = None, per_company: int = REPORTS_PER_COMPANY) -> pd.DataFrame:
+    frame = pd.DataFrame(
+        fetch_reports(conn, company_ids, per_company),
+        columns=["company_id", "report_date", "year", "season"] + REPORT_FIELDS + ["rn", "current_price"]
+    )
+    for column in REPORT_FIELDS + ["current_price"]:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+    return frame
+
+
+def _truthy(values: pd.Series) -> pd.Series:
+    # Mirrors `if not x` in the scalar helpers: NULL and 0 both disqualify
+    return values.notna() & (values != 0)
+
+
+def _ratio(numerator: pd.Series, denominator: pd.Series, scale: float = 1.0) -> pd.Series:
+    valid = _truthy(numerator) & _truthy(denominator)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (numerator / denominator * scale).where(valid)
+
+
+def _days(numerator: pd.Series, denominator: pd.Series) -> pd.Series:
+    return np.trunc(_ratio(numerator, denominator) * 365)
+
+
+def _tiered(values: pd.Series, tiers: List, eligible: Optional[pd.Series] = None) -> np.ndarray:
+    # tiers: [(threshold, points, ">=" | "<=")], first matching tier wins
+    if eligible is None:
+        eligible = _truthy(values)
+    conditions = []
+    for threshold, _, op in tiers:
+        hit = values >= threshold if op == ">=" else values <= threshold
+        conditions.append(eligible & hit.fillna(False))
+    return np.select(conditions, [points for _, points, _ in tiers], default=0)
+
+
+def _pair_f_score(current: pd.DataFrame, previous: pd.DataFrame, has_previous: pd.Series) -> pd.Series:
+    """calculate_f_score over aligned (current, previous) report rows."""
+    net_income = current["net_income"].fillna(0)
+    ocf = current["operating_cash_flow"].fillna(0)
+
+    current_roa = (net_income / current["total_assets"]).where(_truthy(current["total_assets"]), 0)
+    previous_roa = (previous["net_income"].fillna(0) / previous["total_assets"]).where(_truthy(previous["total_assets"]), 0)
+
+    def improved(metric_now: pd.Series, metric_before: pd.Series, lower_is_better: bool = False) -> pd.Series:
+        both = _truthy(metric_now) & _truthy(metric_before)
+        better = metric_now < metric_before if lower_is_better else metric_now > metric_before
+        return both & better
+
+    debt_now = _ratio(current["total_liabilities"], current["total_assets"], 100)
+    debt_before = _ratio(previous["total_liabilities"], previous["total_assets"], 100)
+    cr_now = _ratio(current["current_assets"], current["current_liabilities"])
+    cr_before = _ratio(previous["current_assets"], previous["current_liabilities"])
+    gm_now = _ratio(current["gross_profit"], current["revenue"], 100)
+    gm_before = _ratio(previous["gross_profit"], previous["revenue"], 100)
+    at_now = _ratio(current["revenue"], current["total_assets"])
+    at_before = _ratio(previous["revenue"], previous["total_assets"])
+
+    score = (
+        (net_income > 0).astype(int)
+        + (ocf > 0).astype(int)
+        + (current_roa > previous_roa).astype(int)
+        + (ocf > net_income).astype(int)
+        + improved(debt_now, debt_before, lower_is_better=True).astype(int)
+        + improved(cr_now, cr_before).astype(int)
+        # financial_reports carries no share count, so dilution never scores against
+        + 1
+        + improved(gm_now, gm_before).astype(int)
+        + improved(at_now, at_before).astype(int)
+    )
+    return score.where(has_previous, 0)
+
+
+def compute_cbs_score(frame: pd.DataFrame) -> pd.Series:
+    score = (
+        _tiered(frame["roe"], [(20, 20, ">="), (15, 15, ">="), (10, 10, ">="), (7, 5, ">=")])
+        + _tiered(frame["gross_margin"], [(40, 15, ">="), (30, 10, ">="), (20, 5, ">=")])
+        + _tiered(frame["current_ratio"], [(2, 10, ">="), (1.5, 7, ">="), (1, 3, ">=")])
+        + _tiered(frame["quick_ratio"], [(1, 10, ">="), (0.75, 5, ">=")])
+        + _tiered(frame["debt_ratio"], [(30, 15, "<="), (50, 10, "<="), (70, 5, "<=")], eligible=frame["debt_ratio"].notna())
+        + _tiered(frame["cash_ratio"], [(20, 10, ">="), (10, 5, ">=")])
+        + frame["f_score"].fillna(0).to_numpy() * 2
+    )
+    return pd.Series(np.minimum(score, 100), index=frame.index)
+
+
+def compute_signal(cbs_score: pd.Series, pe_ttm: pd.Series) -> pd.Series:
+    pe = pe_ttm.where(_truthy(pe_ttm))
+    signal = np.select(
+        [cbs_score < 40, pe.isna(), pe < 10, pe < 15, pe < 25],
+        ["觀望", "中等", "低估", "低價", "中等"],
+        default="過熱"
+    )
+    return pd.Series(signal, index=cbs_score.index, dtype=object)
+
+
+def compute_indicators(reports: pd.DataFrame, per_company: int = REPORTS_PER_COMPANY) -> pd.DataFrame:
+    """Vectorised equivalent of compute_company_indicators for many companies.
+
+    `reports` is the frame from load_reports: newest first per company, with
+    the latest close in `current_price`. Only the newest `per_company` reports
+    are returned; older ones are loaded only to pair F-Score against.
+    """
+    r = reports.reset_index(drop=True)
+    out = r[["company_id", "report_date", "year", "season"]].copy()
+
+    out["roe"] = _ratio(r["net_income"], r["stockholders_equity"], 100)
+    out["net_margin"] = _ratio(r["net_income"], r["revenue"], 100)
+    out["gross_margin"] = _ratio(r["gross_profit"], r["revenue"], 100)
+    out["operating_margin"] = _ratio(r["operating_profit"], r["revenue"], 100)
+    out["asset_turnover"] = _ratio(r["revenue"], r["total_assets"])
+    out["equity_multiplier"] = _ratio(r["total_assets"], r["stockholders_equity"])
+    out["current_ratio"] = _ratio(r["current_assets"], r["current_liabilities"])
+    quick_assets = (r["current_assets"] - r["inventory"].fillna(0)).where(_truthy(r["current_assets"]))
+    out["quick_ratio"] = (quick_assets / r["current_liabilities"]).where(
+        _truthy(r["current_assets"]) & _truthy(r["current_liabilities"])
+    )
+    out["debt_ratio"] = _ratio(r["total_liabilities"], r["total_assets"], 100)
+    out["cash_ratio"] = _ratio(r["cash_and_equivalents"], r["current_liabilities"], 100)
+    out["inventory_turnover_days"] = _days(r["inventory"], r["cost_of_goods_sold"])
+    out["accounts_receivable_turnover_days"] = _days(r["accounts_receivable"], r["revenue"])
+    out["goodwill_ratio"] = _ratio(r["goodwill"], r["total_assets"], 100).fillna(0.0)
+    out["interest_coverage"] = _ratio(r["operating_profit"], r["interest_expense"].abs())
+    out["short_debt_to_cash"] = _ratio(r["short_term_debt"], r["cash_and_equivalents"], 100)
+
+    price = r["current_price"]
+    out["pe_ttm"] = (price / r["eps"]).where(_truthy(price) & _truthy(r["eps"]) & (r["eps"] > 0))
+
+    # Each report is scored against the same quarter one year earlier
+    prior = r.assign(year=r["year"] + 1)
+    previous = r[["company_id", "year", "season"]].merge(
+        prior, on=["company_id", "year", "season"], how="left", suffixes=("", "_prior")
+    )
+    out["f_score"] = _pair_f_score(r, previous, previous["report_date"].notna()).astype("float64")
+
+    out["cbs_score"] = compute_cbs_score(out)
+    out["signal"] = compute_signal(out["cbs_score"], out["pe_ttm"])
+    return out[r.groupby("company_id").cumcount() < per_company].reset_index(drop=True)
+
+
+def indicator_rows(frame: pd.DataFrame, columns: List[str]) -> Iterator[tuple]:
+    """Rows for bulk_upsert: NaN becomes NULL, out-of-range ratios are dropped."""
+    data = frame[columns].copy()
+    for column in RATIO_COLUMNS:
+        if column in data:
+            data[column] = data[column].where(data[column].abs() < NUMERIC_LIMIT)
+    for column in INTEGER_COLUMNS:
+        if column in data:
+            data[column] = data[column].round().astype("Int64")
+    data = data.astype(object).where(data.notna(), None)
+    return data.itertuples(index=False, name=None)
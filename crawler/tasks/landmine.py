@@ -0,0 +1,62 @@
+from typing import List, Optional
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# One bit per 排雷 rule in the README, stored in indicators.landmine_flags
+DEBT_SERVICING = 1
+GOODWILL = 2
+LOW_CASH = 4
+LEVERAGE = 8
+SHORT_DEBT = 16
+
+LANDMINE_FLAGS = {
+    "debt_servicing": DEBT_SERVICING,
+    "goodwill": GOODWILL,
+    "cash": LOW_CASH,
+    "leverage": LEVERAGE,
+    "short_debt": SHORT_DEBT,
+}
+
+LEVERAGE_MULTIPLE = 1.3
+
+# Predicates over indicators `i` and its industry_benchmarks row `b`; ratios
+# follow the indicators columns (current/quick ratio and coverage are plain
+# multiples, the rest are percentages). A NULL input never raises a flag.
+LANDMINE_RULES = {
+    DEBT_SERVICING: "i.current_ratio < 1 AND i.quick_ratio < 1 AND i.interest_coverage < 5",
+    GOODWILL: "i.goodwill_ratio > 5",
+    LOW_CASH: "i.cash_ratio < 10",
+    LEVERAGE: f"i.equity_multiplier > b.median_equity_multiplier * {LEVERAGE_MULTIPLE}",
+    SHORT_DEBT: "i.short_debt_to_cash > 70 AND i.short_debt_to_ev > 40",
+}
+
+
+def flags_expression() -> str:
+    return " + ".join(f"CASE WHEN {rule} THEN {bit} ELSE 0 END" for bit, rule in LANDMINE_RULES.items())
+
+
+def update_flags(conn, company_ids: Optional[List[int]] = None) -> int:
+    """Re-evaluate every rule for every company-quarter in one set-based pass.
+
+    Runs after anything its inputs depend on: the report ratios, the daily
+    short_debt_to_ev and the industry medians. Rows whose bitmask is
+    unchanged are not rewritten.
+    """
+    where = "AND i.company_id = ANY(:company_ids)" if company_ids is not None else ""
+    result = conn.execute(text(f"""
+        UPDATE indicators SET landmine_flags = f.flags
+        FROM (
+            SELECT i.id, ({flags_expression()})::smallint AS flags
+            FROM indicators i
+            JOIN companies c ON c.id = i.company_id
+            LEFT JOIN industry_benchmarks b
+                ON b.industry = c.industry AND b.year = i.year AND b.season = i.season
+            WHERE TRUE {where}
+        ) f
+        WHERE indicators.id = f.id AND indicators.landmine_flags <> f.flags
+    """), {"company_ids": company_ids})
+    logger.info(f"Updated landmine flags on {result.rowcount} indicator rows")
+    return result.rowcount
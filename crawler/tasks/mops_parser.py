@@ -0,0 +1,176 @@
+import re
+from decimal import Decimal
+from typing import Dict, Optional, Union
+import logging
+
+import lxml.html
+from lxml import etree
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+LABEL_MAPPINGS = {
+    "balance": {
+        "資產總計": "total_assets",
+        "負債總計": "total_liabilities",
+        "權益總額": "stockholders_equity",
+        "流動資產": "current_assets",
+        "流動負債": "current_liabilities",
+        "存貨": "inventory",
+        "應收帳款淨額": "accounts_receivable",
+        "應收帳款": "accounts_receivable",
+        "現金及約當現金": "cash_and_equivalents",
+        "商譽": "goodwill",
+        "短期借款": "short_term_debt",
+        "長期借款": "long_term_debt",
+        "不動產、廠房及設備": "fixed_assets",
+        "固定資產": "fixed_assets",
+        "普通股股本": "common_stock",
+    },
+    "income": {
+        "營業收入": "revenue",
+        "營業成本": "cost_of_goods_sold",
+        "營業毛利": "gross_profit",
+        "營業費用": "operating_expenses",
+        "營業利益": "operating_profit",
+        "營業外收入及支出": "non_operating_income",
+        "財務成本": "interest_expense",
+        "本期淨利": "net_income",
+        "本期綜合損益總額": "net_income",
+        "基本每股盈餘": "eps",
+    },
+    "cashflow": {
+        "營業活動之淨現金流入": "operating_cash_flow",
+        "營業活動之淨現金流量": "operating_cash_flow",
+        "投資活動之淨現金流入": "investing_cash_flow",
+        "投資活動之淨現金流量": "investing_cash_flow",
+        "籌資活動之淨現金流入": "financing_cash_flow",
+        "籌資活動之淨現金流量": "financing_cash_flow",
+        "發放現金股利": "dividends_paid",
+    }
+}
+
+MAX_MEMO_LABELS = 10000
+
+# Per-share amounts keep their cents; everything else is whole thousands of NTD
+DECIMAL_KEYS = {"eps"}
+
+_HAS_BORDER_TABLES = etree.XPath("//table[contains(concat(' ', normalize-space(@class), ' '), ' hasBorder ')]")
+
+
+class LabelMatcher:
+    """Compiled form of one LABEL_MAPPINGS table.
+
+    Gives the same answer as scanning the table in order for the first
+    substring hit: exact labels and previously seen labels are dict lookups,
+    anything else is one pass of an alternation regex whose hits are ranked by
+    table order.
+    """
+
+    def __init__(self, report_type: str):
+        self.report_type = report_type
+        self.mapping = LABEL_MAPPINGS[report_type]
+        self.priority = {label: i for i, label in enumerate(self.mapping)}
+        self.values = list(self.mapping.values())
+        alternation = "|".join(re.escape(label) for label in self.mapping)
+        # Zero-width lookahead so overlapping candidates are all reported
+        self.pattern = re.compile(f"(?=({alternation}))")
+        self.memo: Dict[str, Optional[str]] = {
+            label: _map_label_to_key(label, report_type) for label in self.mapping
+        }
+
+    def match(self, label: str) -> Optional[str]:
+        try:
+            return self.memo[label]
+        except KeyError:
+            pass
+
+        best = None
+        for hit in self.pattern.finditer(label):
+            rank = self.priority[hit.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if rank == 0:
+                    break
+        key = self.values[best] if best is not None else None
+
+        if len(self.memo) < MAX_MEMO_LABELS:
+            self.memo[label] = key
+        return key
+
+
+def _cell_text(cell) -> str:
+    return "".join(part.strip() for part in cell.itertext())
+
+
+def parse_financial_html(html: str, report_type: str) -> Dict:
+    matcher = _MATCHERS.get(report_type)
+    if matcher is None or not html or "hasBorder" not in html:
+        return {}
+    
+    try:
+        root = lxml.html.fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        return parse_financial_html_soup(html, report_type)
+    except etree.ParserError:
+        return {}
+    
+    result = {}
+    for table in _HAS_BORDER_TABLES(root):
+        for row in table.iter("tr"):
+            cells = list(row.iter("td"))
+            if len(cells) >= 2:
+                key = matcher.match(_cell_text(cells[0]))
+                if key:
+                    result[key] = _parse_value(_cell_text(cells[1]), key in DECIMAL_KEYS)
+    
+    return result
+
+
+def parse_financial_html_soup(html: str, report_type: str) -> Dict:
+    soup = BeautifulSoup(html, "html.parser")
+    result = {}
+    
+    tables = soup.find_all("table", {"class": "hasBorder"})
+    if not tables:
+        return result
+    
+    for table in tables:
+        rows = table.find_all("tr")
+        for row in rows:
+            cells = row.find_all("td")
+            if len(cells) >= 2:
+                label = cells[0].get_text(strip=True)
+                value_str = cells[1].get_text(strip=True) if len(cells) > 1 else ""
+                
+                key = _map_label_to_key(label, report_type)
+                if key:
+                    result[key] = _parse_value(value_str, key in DECIMAL_KEYS)
+    
+    return result
+
+
+def _map_label_to_key(label: str, report_type: str) -> Optional[str]:
+    mapping = LABEL_MAPPINGS.get(report_type, {})
+    for key, value in mapping.items():
+        if key in label:
+            return value
+    return None
+
+
+def _parse_value(s: str, decimal: bool = False) -> Optional[Union[int, Decimal]]:
+    if not s or s in ["-", "--", "N/A", ""]:
+        return None
+    try:
+        s = s.replace(",", "").replace(" ", "").replace("　", "").strip()
+        if s.startswith("(") and s.endswith(")"):
+            s = "-" + s[1:-1]
+        if decimal:
+            return Decimal(s)
+        return int(float(s))
+    except:
+        return None
+
+
+_MATCHERS = {report_type: LabelMatcher(report_type) for report_type in LABEL_MAPPINGS}
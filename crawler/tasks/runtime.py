@@ -0,0 +1,81 @@
+import httpx
+import asyncio
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import os
+import logging
+
+from celery.signals import worker_process_init, worker_process_shutdown
+
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+
+UPSTREAM_HOSTS = (
+    "www.twse.com.tw",
+    "openapi.twse.com.tw",
+    "mops.twse.com.tw",
+    "www.tpex.org.tw",
+)
+
+# Worker-lifetime resources: one event loop and one keep-alive client per host
+# per worker process, so consecutive tasks reuse warm TLS connections.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def run(coro):
+    return get_loop().run_until_complete(coro)
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    host = urlsplit(url).hostname or ""
+    client = _clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+        _clients[host] = client
+    return client
+
+
+async def _close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+@worker_process_init.connect
+def init_worker_resources(**kwargs):
+    get_loop()
+    for host in UPSTREAM_HOSTS:
+        get_client(f"https://{host}/")
+    logger.info(f"Worker {os.getpid()} ready with {len(_clients)} pooled HTTP clients")
+
+
+@worker_process_shutdown.connect
+def close_worker_resources(**kwargs):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        return
+    try:
+        _loop.run_until_complete(_close_clients())
+        _loop.run_until_complete(_loop.shutdown_asyncgens())
+    finally:
+        _loop.close()
+        _loop = None
@@ -0,0 +1,20 @@
+import time
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# One row per company: latest indicators, company attributes and latest price
+SNAPSHOT_VIEW = "latest_indicator_snapshot"
+
+
+def refresh_snapshot(conn):
+    """Rebuild the screener snapshot without blocking its readers.
+
+    Call at the end of a job's write transaction so the snapshot and the
+    tables it reads commit together.
+    """
+    started = time.monotonic()
+    conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {SNAPSHOT_VIEW}"))
+    logger.info(f"Refreshed {SNAPSHOT_VIEW} in {time.monotonic() - started:.2f}s")
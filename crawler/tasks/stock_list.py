@@ -1,14 +1,17 @@
 import httpx
 import asyncio
 from bs4 import BeautifulSoup
-from datetime import datetime
-from typing import List, Dict, Optional
+from datetime import datetime, date
+from typing import List, Dict, Optional, Tuple
 import sqlalchemy
 from sqlalchemy import text
 import os
 import logging
 
-from tasks import app
+from tasks import app, events, snapshot
+from tasks.fetcher import Fetcher
+from tasks.runtime import run
+from tasks.bulk import bulk_upsert
 
 logger = logging.getLogger(__name__)
 
@@ -18,72 +21,126 @@ engine = sqlalchemy.create_engine(DATABASE_URL.replace("postgresql://", "postgre
 TWSE_STOCK_LIST_URL = "https://www.twse.com.tw/exchangeReport/STOCK_DAY_ALL"
 OTC_STOCK_LIST_URL = "https://www.tpex.org.tw/web/stock/aftertrading/daily_close_quotes/stk_quote_result.php"
 
+COMPANY_COLUMNS = ["stock_code", "name", "market", "delisted_date"]
 
-async def fetch_twse_stocks() -> List[Dict]:
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(
-            "https://openapi.twse.com.tw/v1/exchangeReport/STOCK_DAY_ALL",
-            headers={"Accept": "application/json"}
-        )
-        if response.status_code == 200:
-            data = response.json()
-            return [
-                {
-                    "stock_code": item.get("Code", ""),
-                    "name": item.get("Name", ""),
-                    "market": "上市"
-                }
-                for item in data
-            ]
+
+async def fetch_twse_stocks(fetcher: Fetcher) -> List[Dict]:
+    response = await fetcher.get(
+        "https://openapi.twse.com.tw/v1/exchangeReport/STOCK_DAY_ALL",
+        headers={"Accept": "application/json"}
+    )
+    if response.status_code == 200:
+        data = response.json()
+        return [
+            {
+                "stock_code": item.get("Code", ""),
+                "name": item.get("Name", ""),
+                "market": "上市"
+            }
+            for item in data
+        ]
     return []
 
 
-async def fetch_otc_stocks() -> List[Dict]:
+async def fetch_otc_stocks(fetcher: Fetcher) -> List[Dict]:
     stocks = []
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(OTC_STOCK_LIST_URL)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("aaData"):
-                for item in data["aaData"]:
-                    if len(item) >= 2:
-                        stocks.append({
-                            "stock_code": item[0],
-                            "name": item[1],
-                            "market": "上櫃"
-                        })
+    response = await fetcher.get(OTC_STOCK_LIST_URL)
+    if response.status_code == 200:
+        data = response.json()
+        if data.get("aaData"):
+            for item in data["aaData"]:
+                if len(item) >= 2:
+                    stocks.append({
+                        "stock_code": item[0],
+                        "name": item[1],
+                        "market": "上櫃"
+                    })
     return stocks
 
 
+async def fetch_all_stocks() -> Tuple[List[Dict], List[Dict]]:
+    async with Fetcher() as fetcher:
+        twse_stocks, otc_stocks = await asyncio.gather(
+            fetch_twse_stocks(fetcher),
+            fetch_otc_stocks(fetcher)
+        )
+    return twse_stocks, otc_stocks
+
+
+def diff_stock_list(current: List, fetched: List[Dict], today: date) -> Tuple[List[Dict], Dict]:
+    """Compare the stored companies with the fetched lists.
+    
+    Returns the rows to write (only those that change) and a change summary.
+    """
+    existing = {code: (name, market, delisted_date) for code, name, market, delisted_date in current}
+    
+    listed = {}
+    for stock in fetched:
+        code = stock["stock_code"].strip()
+        if code and code not in listed:
+            listed[code] = stock
+    
+    changes = []
+    summary = {"inserted": [], "renamed": [], "moved": [], "delisted": [], "relisted": []}
+    
+    for code, stock in listed.items():
+        if code not in existing:
+            changes.append({"stock_code": code, "name": stock["name"], "market": stock["market"], "delisted_date": None})
+            summary["inserted"].append(code)
+            continue
+        
+        name, market, delisted_date = existing[code]
+        if name != stock["name"]:
+            summary["renamed"].append({"stock_code": code, "from": name, "to": stock["name"]})
+        if market != stock["market"]:
+            summary["moved"].append({"stock_code": code, "from": market, "to": stock["market"]})
+        if delisted_date is not None:
+            summary["relisted"].append(code)
+        if name != stock["name"] or market != stock["market"] or delisted_date is not None:
+            changes.append({"stock_code": code, "name": stock["name"], "market": stock["market"], "delisted_date": None})
+    
+    for code, (name, market, delisted_date) in existing.items():
+        if code not in listed and delisted_date is None and market in ("上市", "上櫃"):
+            changes.append({"stock_code": code, "name": name, "market": market, "delisted_date": today})
+            summary["delisted"].append(code)
+    
+    return changes, summary
+
+
 @app.task(bind=True, max_retries=3)
 def update_stock_list(self):
     logger.info("Starting stock list update...")
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        twse_stocks, otc_stocks = run(fetch_all_stocks())
+        logger.info(f"Fetched {len(twse_stocks)} TWSE and {len(otc_stocks)} OTC stocks")
         
-        twse_stocks = loop.run_until_complete(fetch_twse_stocks())
-        otc_stocks = loop.run_until_complete(fetch_otc_stocks())
-        
-        all_stocks = twse_stocks + otc_stocks
-        logger.info(f"Fetched {len(all_stocks)} stocks")
+        # An empty list means the upstream failed, not that the whole market delisted
+        if not twse_stocks or not otc_stocks:
+            raise RuntimeError("Stock list fetch returned an empty market, refusing to diff")
         
         with engine.begin() as conn:
-            for stock in all_stocks:
-                conn.execute(text("""
-                    INSERT INTO companies (stock_code, name, market)
-                    VALUES (:stock_code, :name, :market)
-                    ON CONFLICT (stock_code) 
-                    DO UPDATE SET name = EXCLUDED.name, market = EXCLUDED.market
-                """), stock)
+            current = conn.execute(text(
+                "SELECT stock_code, name, market, delisted_date FROM companies"
+            )).fetchall()
+            
+            changes, summary = diff_stock_list(current, twse_stocks + otc_stocks, date.today())
+            if changes:
+                bulk_upsert(
+                    conn, "companies", COMPANY_COLUMNS,
+                    ([row[col] for col in COMPANY_COLUMNS] for row in changes),
+                    conflict_columns=["stock_code"]
+                )
+                snapshot.refresh_snapshot(conn)
+        
+        if changes:
+            events.publish("all")
         
-        logger.info(f"Updated {len(all_stocks)} stocks in database")
-        return {"status": "success", "count": len(all_stocks)}
+        counts = {key: len(value) for key, value in summary.items()}
+        logger.info(f"Stock list: {len(current)} known, {len(changes)} changed {counts}")
+        return {"status": "success", "count": len(twse_stocks) + len(otc_stocks), "changes": counts, "summary": summary}
         
     except Exception as e:
         logger.error(f"Error updating stock list: {e}")
         self.retry(exc=e, countdown=60)
         return {"status": "error", "message": str(e)}
-    finally:
-        loop.close()
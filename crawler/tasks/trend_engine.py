@@ -0,0 +1,392 @@
+import io
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+TREND_WINDOW = 1278
+MIN_TREND_DAYS = 252
+
+EPOCH = date(1970, 1, 1)
+
+TREND_COLUMNS = [
+    "company_id", "calculation_date", "period_days",
+    "trend_line", "sd_plus_2", "sd_plus_1", "sd_minus_1", "sd_minus_2",
+    "current_price", "position", "r_squared"
+]
+
+# Running sums per company; x is days since `origin`, reset on every full refit
+STATE_COLUMNS = [
+    "company_id", "origin", "window_start", "window_end", "n",
+    "sum_x", "sum_y", "sum_xy", "sum_xx", "sum_yy", "last_close",
+    "prices_updated_at", "computed_at", "refit_at"
+]
+SUM_COLUMNS = ["sum_x", "sum_y", "sum_xy", "sum_xx", "sum_yy"]
+
+
+def load_close_matrix(
+    conn,
+    company_ids: Optional[Sequence[int]] = None,
+    window: int = TREND_WINDOW
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Trailing closes for every company in one COPY.
+
+    Returns (company_ids, days, closes, updated_at): `days` and `closes` are
+    (companies x window) float matrices, newest trading day in column 0,
+    padded with NaN where a company has a shorter history; `updated_at` is
+    the latest stock_prices.updated_at among each company's loaded rows.
+    """
+    where = "WHERE close IS NOT NULL"
+    if company_ids is not None:
+        if not company_ids:
+            return (
+                np.empty(0, dtype=np.int64), np.empty((0, window)), np.empty((0, window)),
+                np.empty(0, dtype="datetime64[ns]")
+            )
+        where += f" AND company_id IN ({', '.join(str(int(c)) for c in company_ids)})"
+
+    sql = f"""
+        COPY (
+            SELECT company_id, date - DATE '{EPOCH.isoformat()}' AS day, close, rn, updated_at
+            FROM (
+                SELECT company_id, date, close, updated_at,
+                       ROW_NUMBER() OVER (PARTITION BY company_id ORDER BY date DESC) AS rn
+                FROM stock_prices
+                {where}
+            ) ranked
+            WHERE rn <= {int(window)}
+        ) TO STDOUT WITH (FORMAT csv)
+    """
+    buffer = io.StringIO()
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+    buffer.seek(0)
+
+    frame = pd.read_csv(
+        buffer, header=None, names=["company_id", "day", "close", "rn", "updated_at"],
+        dtype={"company_id": np.int64, "day": np.float64, "close": np.float64, "rn": np.int64},
+        parse_dates=["updated_at"]
+    )
+    ids, rows = np.unique(frame["company_id"].to_numpy(), return_inverse=True)
+    cols = frame["rn"].to_numpy() - 1
+
+    days = np.full((len(ids), window), np.nan)
+    closes = np.full((len(ids), window), np.nan)
+    days[rows, cols] = frame["day"].to_numpy()
+    closes[rows, cols] = frame["close"].to_numpy()
+    updated_at = frame.groupby("company_id")["updated_at"].max().reindex(ids).to_numpy(dtype="datetime64[ns]")
+    return ids, days, closes, updated_at
+
+
+def fit_trends(days: np.ndarray, closes: np.ndarray) -> dict:
+    """Least-squares line per row of a NaN-padded matrix.
+
+    x is centred per row before the sums are formed, which keeps the
+    closed form numerically stable for epoch-day abscissae. std_dev is the
+    population standard deviation of the residuals, matching np.std.
+    """
+    mask = ~np.isnan(closes) & ~np.isnan(days)
+    n = mask.sum(axis=1)
+    safe_n = np.maximum(n, 1)
+
+    x = np.where(mask, days, 0.0)
+    y = np.where(mask, closes, 0.0)
+    x_mean = x.sum(axis=1) / safe_n
+    y_mean = y.sum(axis=1) / safe_n
+
+    dx = np.where(mask, x - x_mean[:, None], 0.0)
+    dy = np.where(mask, y - y_mean[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    sxy = (dx * dy).sum(axis=1)
+    syy = (dy * dy).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        r_squared = np.where(syy > 0, sxy * sxy / (sxx * syy), 0.0)
+        residual_ss = np.maximum(syy - slope * sxy, 0.0)
+        std_dev = np.sqrt(residual_ss / safe_n)
+
+    # Column 0 is the newest day of every row that has any data
+    trend_line = y_mean + slope * (days[:, 0] - x_mean)
+    return {
+        "n": n,
+        "slope": slope,
+        "trend_line": trend_line,
+        "std_dev": std_dev,
+        "r_squared": r_squared,
+        "current_price": closes[:, 0],
+    }
+
+
+def band_positions(current: np.ndarray, trend_line: np.ndarray, std_dev: np.ndarray) -> np.ndarray:
+    return np.select(
+        [
+            current >= trend_line + 2 * std_dev,
+            current >= trend_line + std_dev,
+            current <= trend_line - 2 * std_dev,
+            current <= trend_line - std_dev,
+        ],
+        ["+2SD", "+1SD", "-2SD", "-1SD"],
+        default="TL"
+    )
+
+
+def trend_rows(
+    company_ids: np.ndarray,
+    fit: dict,
+    calculation_date: date,
+    window: int = TREND_WINDOW,
+    min_days: int = MIN_TREND_DAYS
+) -> Iterator[List]:
+    trend_line = fit["trend_line"]
+    std_dev = fit["std_dev"]
+    positions = band_positions(fit["current_price"], trend_line, std_dev)
+    eligible = (fit["n"] >= min_days) & np.isfinite(trend_line)
+
+    for i in np.flatnonzero(eligible):
+        line = float(trend_line[i])
+        sd = float(std_dev[i])
+        yield [
+            int(company_ids[i]), calculation_date, window,
+            line, line + 2 * sd, line + sd, line - sd, line - 2 * sd,
+            float(fit["current_price"][i]), str(positions[i]), float(fit["r_squared"][i])
+        ]
+
+
+def _day(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def _date(day) -> date:
+    return EPOCH + timedelta(days=int(day))
+
+
+def matrix_states(company_ids: np.ndarray, days: np.ndarray, closes: np.ndarray, updated_at: np.ndarray) -> pd.DataFrame:
+    """Sufficient statistics of each row of a close matrix, origin at its oldest day."""
+    mask = ~np.isnan(closes)
+    origin = np.where(mask, days, np.inf).min(axis=1)
+    x = np.where(mask, days - origin[:, None], 0.0)
+    y = np.where(mask, closes, 0.0)
+    frame = pd.DataFrame({
+        "company_id": company_ids,
+        "origin": origin,
+        "window_start": origin,
+        "window_end": days[:, 0],
+        "n": mask.sum(axis=1),
+        "sum_x": x.sum(axis=1),
+        "sum_y": y.sum(axis=1),
+        "sum_xy": (x * y).sum(axis=1),
+        "sum_xx": (x * x).sum(axis=1),
+        "sum_yy": (y * y).sum(axis=1),
+        "last_close": closes[:, 0],
+        "prices_updated_at": updated_at,
+    })
+    return frame[frame["n"] > 0].reset_index(drop=True)
+
+
+def load_states(conn, company_ids: Sequence[int]) -> pd.DataFrame:
+    result = conn.execute(text(f"""
+        SELECT {', '.join(STATE_COLUMNS[:-2])}
+        FROM trend_regression_state
+        WHERE company_id = ANY(:company_ids)
+    """), {"company_ids": list(company_ids)})
+    frame = pd.DataFrame(result.fetchall(), columns=STATE_COLUMNS[:-2])
+    for column in ["origin", "window_start", "window_end"]:
+        frame[column] = frame[column].map(_day).astype("float64")
+    for column in SUM_COLUMNS + ["last_close"]:
+        frame[column] = frame[column].astype("float64")
+    frame["n"] = frame["n"].astype("int64")
+    frame["prices_updated_at"] = pd.to_datetime(frame["prices_updated_at"])
+    return frame
+
+
+def revised_companies(conn, company_ids: Sequence[int]) -> List[int]:
+    """Companies whose stored window had a close inserted or corrected after it was summed.
+
+    Only dates inside the summed window count: a row written later than the
+    newest row that went into the sums. Closes after window_end are the
+    ones the slide appends, not revisions. States stored before the
+    watermark existed are always refitted once.
+    """
+    result = conn.execute(text("""
+        SELECT s.company_id
+        FROM trend_regression_state s
+        WHERE s.company_id = ANY(:company_ids)
+          AND (
+              s.prices_updated_at IS NULL
+              OR EXISTS (
+                  SELECT 1 FROM stock_prices p
+                  WHERE p.company_id = s.company_id
+                    AND p.date BETWEEN s.window_start AND s.window_end
+                    AND p.updated_at > s.prices_updated_at
+              )
+          )
+    """), {"company_ids": list(company_ids)})
+    return [row[0] for row in result.fetchall()]
+
+
+def load_entering(conn, company_ids: Sequence[int]) -> pd.DataFrame:
+    """Closes newer than each stored window."""
+    result = conn.execute(text(f"""
+        SELECT s.company_id, p.date - DATE '{EPOCH.isoformat()}' AS day, p.close, p.updated_at
+        FROM trend_regression_state s
+        JOIN stock_prices p ON p.company_id = s.company_id AND p.date > s.window_end
+        WHERE s.company_id = ANY(:company_ids) AND p.close IS NOT NULL
+        ORDER BY s.company_id, p.date
+    """), {"company_ids": list(company_ids)})
+    frame = pd.DataFrame(result.fetchall(), columns=["company_id", "day", "close", "updated_at"]).astype(
+        {"day": "float64", "close": "float64"}
+    )
+    frame["updated_at"] = pd.to_datetime(frame["updated_at"])
+    return frame
+
+
+def load_leaving(conn, drops: Dict[int, int]) -> pd.DataFrame:
+    """The `drop` oldest closes of each window, plus the one that becomes its new start."""
+    if not drops:
+        return pd.DataFrame(columns=["company_id", "day", "close"])
+    result = conn.execute(text(f"""
+        SELECT d.company_id, l.day, l.close
+        FROM unnest(CAST(:company_ids AS integer[]), CAST(:drops AS integer[])) AS d(company_id, drop_count)
+        JOIN trend_regression_state s ON s.company_id = d.company_id
+        CROSS JOIN LATERAL (
+            SELECT p.date - DATE '{EPOCH.isoformat()}' AS day, p.close
+            FROM stock_prices p
+            WHERE p.company_id = d.company_id AND p.date >= s.window_start AND p.close IS NOT NULL
+            ORDER BY p.date
+            LIMIT d.drop_count + 1
+        ) l
+        ORDER BY d.company_id, l.day
+    """), {"company_ids": list(drops), "drops": list(drops.values())})
+    return pd.DataFrame(result.fetchall(), columns=["company_id", "day", "close"]).astype(
+        {"day": "float64", "close": "float64"}
+    )
+
+
+def _sums(rows: pd.DataFrame, origin: pd.Series) -> pd.DataFrame:
+    x = rows["day"] - rows["company_id"].map(origin)
+    y = rows["close"]
+    parts = pd.DataFrame({
+        "company_id": rows["company_id"],
+        "n": 1, "sum_x": x, "sum_y": y, "sum_xy": x * y, "sum_xx": x * x, "sum_yy": y * y,
+    })
+    return parts.groupby("company_id").sum()
+
+
+def advance_states(
+    states: pd.DataFrame,
+    entering: pd.DataFrame,
+    leaving: pd.DataFrame,
+    drops: Dict[int, int]
+) -> pd.DataFrame:
+    """Slide each stored window forward: add the entering closes, subtract the dropped ones."""
+    states = states.set_index("company_id")
+    origin = states["origin"]
+    columns = ["n"] + SUM_COLUMNS
+
+    added = _sums(entering, origin).reindex(states.index, fill_value=0)
+    states[columns] = states[columns] + added[columns]
+
+    latest = entering.groupby("company_id").last()
+    states.loc[latest.index, "window_end"] = latest["day"]
+    states.loc[latest.index, "last_close"] = latest["close"]
+    newest = entering.groupby("company_id")["updated_at"].max()
+    states.loc[newest.index, "prices_updated_at"] = pd.concat(
+        [states.loc[newest.index, "prices_updated_at"], newest], axis=1
+    ).max(axis=1)
+
+    rank = leaving.groupby("company_id").cumcount()
+    drop_count = leaving["company_id"].map(drops)
+    dropped = leaving[rank < drop_count]
+    removed = _sums(dropped, origin).reindex(states.index, fill_value=0)
+    states[columns] = states[columns] - removed[columns]
+
+    new_start = leaving[rank == drop_count].set_index("company_id")["day"]
+    states.loc[new_start.index, "window_start"] = new_start
+    states["n"] = states["n"].astype("int64")
+    return states.reset_index()
+
+
+def fit_states(states: pd.DataFrame) -> dict:
+    """Same outputs as fit_trends, from the stored sums alone."""
+    n = states["n"].to_numpy(dtype="float64")
+    safe_n = np.maximum(n, 1)
+    sx, sy = states["sum_x"].to_numpy(), states["sum_y"].to_numpy()
+    x_mean, y_mean = sx / safe_n, sy / safe_n
+    sxx = states["sum_xx"].to_numpy() - sx * x_mean
+    sxy = states["sum_xy"].to_numpy() - sx * y_mean
+    syy = states["sum_yy"].to_numpy() - sy * y_mean
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        r_squared = np.where(syy > 0, np.clip(sxy * sxy / (sxx * syy), 0.0, 1.0), 0.0)
+        std_dev = np.sqrt(np.maximum(syy - slope * sxy, 0.0) / safe_n)
+
+    x_last = (states["window_end"] - states["origin"]).to_numpy()
+    return {
+        "n": states["n"].to_numpy(),
+        "slope": slope,
+        "trend_line": y_mean + slope * (x_last - x_mean),
+        "std_dev": std_dev,
+        "r_squared": r_squared,
+        "current_price": states["last_close"].to_numpy(),
+    }
+
+
+def state_rows(states: pd.DataFrame, computed_at: datetime, refit: bool) -> Iterator[List]:
+    for row in states.itertuples(index=False):
+        yield [
+            int(row.company_id), _date(row.origin), _date(row.window_start), _date(row.window_end), int(row.n),
+            row.sum_x, row.sum_y, row.sum_xy, row.sum_xx, row.sum_yy, row.last_close,
+            None if pd.isna(row.prices_updated_at) else pd.Timestamp(row.prices_updated_at).to_pydatetime(),
+            computed_at, computed_at if refit else None
+        ]
+
+
+def refresh_trends(conn, company_ids: Optional[Sequence[int]], refit: bool = False, window: int = TREND_WINDOW):
+    """Fitted trends and regression states for `company_ids` (None: all companies).
+
+    Companies with a stored state whose window has not been revised are
+    slid forward from their sums; everything else is refitted from the
+    close matrix. Returns (company_ids, fit, refitted_states, advanced_states);
+    the states are None/empty when that path was not taken.
+    """
+    refit_ids = company_ids
+    advanced = None
+    if not refit and company_ids is not None:
+        states = load_states(conn, company_ids)
+        stale = set(revised_companies(conn, states["company_id"].tolist()))
+        states = states[~states["company_id"].isin(stale)]
+
+        entering = load_entering(conn, states["company_id"].tolist())
+        incoming = entering.groupby("company_id").size().reindex(states["company_id"], fill_value=0)
+        overflow = (states.set_index("company_id")["n"] + incoming - window).clip(lower=0)
+        # A window that would be replaced wholesale is cheaper to refit
+        stale |= set(overflow[overflow >= states.set_index("company_id")["n"]].index)
+        states = states[~states["company_id"].isin(stale)]
+        entering = entering[~entering["company_id"].isin(stale)]
+        drops = {int(c): int(k) for c, k in overflow.items() if k > 0 and c not in stale}
+
+        advanced = advance_states(states, entering, load_leaving(conn, drops), drops)
+        refit_ids = sorted(set(company_ids) - set(advanced["company_id"]))
+
+    ids, days, closes, updated_at = load_close_matrix(conn, refit_ids, window)
+    refitted = matrix_states(ids, days, closes, updated_at)
+    fit = fit_trends(days, closes)
+    keep = np.isin(ids, refitted["company_id"])
+    ids = ids[keep]
+    fit = {key: value[keep] for key, value in fit.items()}
+
+    if advanced is not None and len(advanced):
+        incremental = fit_states(advanced)
+        ids = np.concatenate([ids, advanced["company_id"].to_numpy()])
+        fit = {key: np.concatenate([fit[key], incremental[key]]) for key in fit}
+    return ids, fit, refitted, advanced
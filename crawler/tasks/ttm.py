@@ -0,0 +1,108 @@
+from typing import Iterator, List, Optional, Sequence
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from tasks.bulk import bulk_upsert
+
+logger = logging.getLogger(__name__)
+
+# How each flow figure is reported by the first value column of the MOPS
+# statements: income statements show the single quarter for Q1-Q3 and the
+# full year for Q4, cash flow statements are always year to date.
+QUARTERLY_WITH_ANNUAL_Q4 = [
+    "revenue", "cost_of_goods_sold", "gross_profit", "operating_profit", "net_income", "eps",
+    "interest_expense",
+]
+YEAR_TO_DATE = ["operating_cash_flow", "dividends_paid"]
+FLOW_FIELDS = QUARTERLY_WITH_ANNUAL_Q4 + YEAR_TO_DATE
+
+TTM_COLUMNS = (
+    ["company_id", "year", "season", "report_date"]
+    + [f"{field}_q" for field in FLOW_FIELDS]
+    + [f"{field}_ttm" for field in FLOW_FIELDS]
+)
+
+
+def load_flows(conn, company_ids: Optional[Sequence[int]] = None) -> pd.DataFrame:
+    where = "WHERE company_id = ANY(:company_ids)" if company_ids is not None else ""
+    result = conn.execute(text(f"""
+        SELECT company_id, year, season, report_date, {', '.join(FLOW_FIELDS)}
+        FROM financial_reports
+        {where}
+    """), {"company_ids": list(company_ids or [])})
+    frame = pd.DataFrame(result.fetchall(), columns=["company_id", "year", "season", "report_date"] + FLOW_FIELDS)
+    for field in FLOW_FIELDS:
+        frame[field] = pd.to_numeric(frame[field], errors="coerce").astype("float64")
+    return frame
+
+
+def _quarter_grid(flows: pd.DataFrame, field: str) -> pd.DataFrame:
+    """company x consecutive-quarter matrix of one field, NaN where not filed."""
+    quarter = flows["year"] * 4 + flows["season"] - 1
+    grid = flows.assign(quarter=quarter).pivot(index="company_id", columns="quarter", values=field)
+    return grid.reindex(columns=range(int(quarter.min()), int(quarter.max()) + 1))
+
+
+def compute_ttm(flows: pd.DataFrame) -> pd.DataFrame:
+    """Discrete quarters and trailing four-quarter sums for every report.
+
+    A discrete quarter needs the earlier quarters of its year that it is
+    netted against, and a TTM value needs four consecutive discrete
+    quarters; anything short of that stays NaN rather than being guessed.
+    """
+    if flows.empty:
+        return pd.DataFrame(columns=TTM_COLUMNS)
+
+    out = flows[["company_id", "year", "season", "report_date"]].copy()
+    quarter = out["year"] * 4 + out["season"] - 1
+
+    for field in FLOW_FIELDS:
+        grid = _quarter_grid(flows, field)
+        seasons = np.broadcast_to(np.asarray(grid.columns) % 4 + 1, grid.shape)
+        prior = grid.shift(1, axis=1)
+
+        if field in YEAR_TO_DATE:
+            # Qn = YTD(n) - YTD(n-1), Q1 is its own year to date
+            discrete = grid.where(seasons == 1, grid - prior)
+        else:
+            # Q4 = FY - (Q1 + Q2 + Q3)
+            first_three = prior + grid.shift(2, axis=1) + grid.shift(3, axis=1)
+            discrete = grid.where(seasons != 4, grid - first_three)
+
+        ttm = discrete + discrete.shift(1, axis=1) + discrete.shift(2, axis=1) + discrete.shift(3, axis=1)
+
+        index = pd.MultiIndex.from_arrays([out["company_id"], quarter])
+        out[f"{field}_q"] = discrete.stack(dropna=False).reindex(index).to_numpy()
+        out[f"{field}_ttm"] = ttm.stack(dropna=False).reindex(index).to_numpy()
+
+    return out[TTM_COLUMNS]
+
+
+def ttm_rows(frame: pd.DataFrame) -> Iterator[tuple]:
+    """Rows for bulk_upsert: amounts back to whole thousands, EPS to cents, NaN to NULL."""
+    data = frame[TTM_COLUMNS].copy()
+    for field in FLOW_FIELDS:
+        for column in (f"{field}_q", f"{field}_ttm"):
+            if field == "eps":
+                data[column] = data[column].round(2)
+            else:
+                data[column] = data[column].round().astype("Int64")
+    data = data.astype(object).where(data.notna(), None)
+    return data.itertuples(index=False, name=None)
+
+
+def refresh_ttm(conn, company_ids: Optional[List[int]] = None) -> int:
+    """Rebuild financial_ttm for `company_ids` (None: every company) in one pass."""
+    frame = compute_ttm(load_flows(conn, company_ids))
+    if frame.empty:
+        return 0
+    count = bulk_upsert(
+        conn, "financial_ttm", TTM_COLUMNS, ttm_rows(frame),
+        conflict_columns=["company_id", "year", "season"],
+        skip_unchanged=True
+    )
+    logger.info(f"Refreshed {count} TTM rows for {frame['company_id'].nunique()} companies")
+    return count
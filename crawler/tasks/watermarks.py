@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+import logging
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Rows committed by an ingest transaction that started just before a job read
+# its inputs carry an updated_at older than the job's start; re-scan a margin.
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+# Tables with (company_id, updated_at) that feed the derived jobs
+CHANGE_SOURCES = ("financial_reports", "stock_prices")
+
+
+def db_now(conn) -> datetime:
+    return conn.execute(text("SELECT LOCALTIMESTAMP")).scalar()
+
+
+def get_watermark(conn, job_name: str) -> Optional[datetime]:
+    return conn.execute(
+        text("SELECT last_run_at FROM job_watermarks WHERE job_name = :job_name"),
+        {"job_name": job_name}
+    ).scalar()
+
+
+def set_watermark(conn, job_name: str, started_at: datetime, companies: int = 0):
+    conn.execute(text("""
+        INSERT INTO job_watermarks (job_name, last_run_at, companies_processed, updated_at)
+        VALUES (:job_name, :started_at, :companies, CURRENT_TIMESTAMP)
+        ON CONFLICT (job_name) DO UPDATE SET
+            last_run_at = EXCLUDED.last_run_at,
+            companies_processed = EXCLUDED.companies_processed,
+            updated_at = EXCLUDED.updated_at
+    """), {"job_name": job_name, "started_at": started_at, "companies": companies})
+
+
+def changed_companies(conn, since: datetime, sources: Sequence[str] = CHANGE_SOURCES) -> List[int]:
+    """Companies with any source row inserted or updated after `since`."""
+    union = " UNION ".join(
+        f"SELECT DISTINCT company_id FROM {table} WHERE updated_at >= :since" for table in sources
+    )
+    result = conn.execute(text(union), {"since": since - WATERMARK_OVERLAP})
+    return sorted(row[0] for row in result.fetchall())
+
+
+def dirty_companies(conn, job_name: str, sources: Sequence[str] = CHANGE_SOURCES, force_full: bool = False):
+    """(started_at, company_ids) for an incremental run of `job_name`.
+
+    company_ids is None when everything has to be rebuilt: on request, or
+    when the job has never completed. Pass started_at to set_watermark once
+    the run succeeds.
+    """
+    started_at = db_now(conn)
+    since = None if force_full else get_watermark(conn, job_name)
+    if since is None:
+        return started_at, None
+    company_ids = changed_companies(conn, since, sources)
+    logger.info(f"{job_name}: {len(company_ids)} companies changed since {since:%Y-%m-%d %H:%M}")
+    return started_at, company_ids
@@ -0,0 +1,75 @@
+"""A quarter stored from a partial fetch must be fetched again by the
+incremental runs until every statement has been stored.
+
+Run from the crawler directory:
+
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+from tasks import financial_report
+from tasks.financial_report import (
+    STATEMENT_FIELDS, _missing_quarters, _stored_quarters, fetch_quarter_report, published_quarters, report_statements
+)
+
+STATEMENTS = {
+    "balance": {"total_assets": 5000, "stockholders_equity": 3000},
+    "income": {"revenue": 1200, "net_income": 150},
+    "cashflow": {"operating_cash_flow": 300},
+}
+
+
+def _fetch_quarter(monkeypatch, failed):
+    async def fetch(fetcher, stock_code, year, season, report_type):
+        # A failed request (timeout, rate limit, non-200) comes back as None
+        return None if report_type in failed else dict(STATEMENTS[report_type])
+
+    monkeypatch.setattr(financial_report, "fetch_financial_report_mops", fetch)
+    return asyncio.run(fetch_quarter_report(None, "2330", 2024, 2))
+
+
+def _stored(report):
+    """The row incremental runs read back for `report`: year, season, one flag per statement."""
+    present = report_statements(report)
+    return _stored_quarters([(report["year"], report["season"], *(t in present for t in STATEMENT_FIELDS))])
+
+
+@pytest.fixture
+def quarter():
+    return published_quarters(2)[-1]
+
+
+@pytest.mark.parametrize("failed", [{"balance"}, {"income"}, {"cashflow"}, {"balance", "cashflow"}])
+def test_partial_quarter_is_fetched_again(monkeypatch, quarter, failed):
+    report = _fetch_quarter(monkeypatch, failed)
+    # What did parse is still stored
+    assert report is not None
+    assert report_statements(report) == set(STATEMENT_FIELDS) - failed
+    report.update(year=quarter[0], season=quarter[1])
+    assert quarter in _missing_quarters(_stored(report), 2)
+
+
+def test_complete_quarter_is_not_fetched_again(monkeypatch, quarter):
+    report = _fetch_quarter(monkeypatch, set())
+    report.update(year=quarter[0], season=quarter[1])
+    assert quarter not in _missing_quarters(_stored(report), 2)
+
+
+def test_failed_quarter_is_not_stored(monkeypatch):
+    assert _fetch_quarter(monkeypatch, set(STATEMENT_FIELDS)) is None
+
+
+def test_missing_quarters():
+    quarters = published_quarters(2)
+    stored = _stored_quarters(
+        [(year, season, True, True, True) for year, season in quarters[:-2]]
+        + [(*quarters[-2], True, False, True)]
+    )
+    assert _missing_quarters(stored, 2) == quarters[-2:]
+
+
+def test_statement_fields_are_disjoint():
+    fields = [field for group in STATEMENT_FIELDS.values() for field in group]
+    assert len(fields) == len(set(fields))
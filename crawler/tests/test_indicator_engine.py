@@ -0,0 +1,137 @@
+"""The vectorised indicator engine must agree with the scalar helpers in
+tasks.indicators, row for row and column for column.
+
+Run from the crawler directory:
+
+    python -m pytest tests
+"""
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from tasks import indicator_engine
+from tasks.indicators import compute_company_indicators
+
+COMPARED_COLUMNS = indicator_engine.RATIO_COLUMNS + indicator_engine.INTEGER_COLUMNS + ["signal"]
+
+
+def _report(company_id, year, season, **fields):
+    report = {field: 1000 for field in indicator_engine.REPORT_FIELDS}
+    report.update(eps=2.5)
+    report.update(fields)
+    report.update(
+        company_id=company_id, year=year, season=season,
+        report_date=date(year, season * 3, 28)
+    )
+    return report
+
+
+def _random_company(rng, company_id):
+    reports = []
+    latest = date(2024, 12, 31)
+    for k in range(rng.randint(1, 12)):
+        if rng.random() < 0.1:
+            # A quarter that was never filed
+            continue
+        fields = {
+            field: rng.choice([None, 0, rng.randint(-5000, 100000)]) if rng.random() < 0.2 else rng.randint(1, 100000)
+            for field in indicator_engine.REPORT_FIELDS
+        }
+        fields["eps"] = rng.choice([None, 0, round(rng.uniform(-3, 20), 2)])
+        report_date = latest - timedelta(days=91 * k)
+        reports.append({
+            **fields, "company_id": company_id, "report_date": report_date,
+            "year": 2024 - k // 4, "season": 4 - k % 4,
+        })
+    price = rng.choice([None, Decimal(str(round(rng.uniform(5, 900), 2)))])
+    return reports, price
+
+
+def _edge_companies():
+    """(reports newest first, latest close) for the cases the helpers special-case."""
+    return [
+        # Zero denominators everywhere
+        ([_report(1, 2024, 4, total_assets=0, stockholders_equity=0, revenue=0,
+                  current_liabilities=0, cost_of_goods_sold=0, cash_and_equivalents=0,
+                  interest_expense=0)], Decimal("50")),
+        # NULL numerators and denominators
+        ([_report(2, 2024, 4, net_income=None, revenue=None, total_assets=None, inventory=None,
+                  goodwill=None, short_term_debt=None, interest_expense=None, eps=None)], Decimal("50")),
+        # Negative EPS and no close: no P/E
+        ([_report(3, 2024, 4, eps=-1.2), _report(3, 2023, 4, eps=0)], None),
+        # Missing quarters: 2024Q3 has no 2023Q3 to pair with, 2024Q4 does
+        ([_report(4, 2024, 4, net_income=900, operating_cash_flow=1200),
+          _report(4, 2024, 3),
+          _report(4, 2023, 4, net_income=100, total_assets=2000, gross_profit=300)], Decimal("12.5")),
+        # Negative interest expense is compared by magnitude
+        ([_report(5, 2024, 4, operating_profit=500, interest_expense=-25)], Decimal("8")),
+        # More reports than are emitted; the oldest only serve as F-Score pairs
+        ([_report(6, 2024 - k // 4, 4 - k % 4, net_income=100 + k) for k in range(12)], Decimal("30")),
+    ]
+
+
+def _universe():
+    rng = random.Random(2)
+    companies = _edge_companies()
+    companies += [_random_company(rng, company_id) for company_id in range(100, 400)]
+    return [(reports, price) for reports, price in companies if reports]
+
+
+def _same(vectorised, scalar):
+    if scalar is None:
+        return vectorised is None or (isinstance(vectorised, float) and math.isnan(vectorised))
+    if isinstance(scalar, str):
+        return vectorised == scalar
+    if vectorised is None or math.isnan(float(vectorised)):
+        return False
+    scalar = float(scalar)
+    return math.isclose(float(vectorised), scalar, rel_tol=1e-9, abs_tol=1e-9)
+
+
+@pytest.fixture(scope="module")
+def computed():
+    universe = _universe()
+    scalar = []
+    rows = []
+    for reports, price in universe:
+        scalar += compute_company_indicators(reports[0]["company_id"], reports, price)
+        rows += [{**report, "current_price": price} for report in reports]
+    frame = pd.DataFrame(rows)
+    for column in indicator_engine.REPORT_FIELDS + ["current_price"]:
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype("float64")
+    return scalar, indicator_engine.compute_indicators(frame)
+
+
+def test_emits_the_same_reports(computed):
+    scalar, vectorised = computed
+    assert [(r["company_id"], r["year"], r["season"]) for r in scalar] == list(
+        vectorised[["company_id", "year", "season"]].itertuples(index=False, name=None)
+    )
+
+
+@pytest.mark.parametrize("column", COMPARED_COLUMNS)
+def test_column_matches_scalar(computed, column):
+    scalar, vectorised = computed
+    mismatches = [
+        (row["company_id"], row["year"], row["season"], value, row.get(column))
+        for row, value in zip(scalar, vectorised[column].tolist())
+        if not _same(value, row.get(column))
+    ]
+    assert mismatches == []
+
+
+def test_edge_cases_are_covered(computed):
+    _, vectorised = computed
+    edges = vectorised[vectorised["company_id"] < 100]
+    # Zero and NULL denominators leave the ratio NULL, never inf
+    assert edges.loc[edges["company_id"].isin([1, 2]), "roe"].isna().all()
+    assert edges.loc[edges["company_id"] == 1, "goodwill_ratio"].eq(0).all()
+    assert edges.loc[edges["company_id"] == 3, "pe_ttm"].isna().all()
+    # Only the quarter with a prior-year filing gets an F-Score
+    f_scores = edges[edges["company_id"] == 4].set_index(["year", "season"])["f_score"]
+    assert f_scores[(2024, 4)] > 0 and f_scores[(2024, 3)] == 0
+    assert len(edges[edges["company_id"] == 6]) == indicator_engine.REPORTS_PER_COMPANY
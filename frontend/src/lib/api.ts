@@ -10,8 +10,8 @@ const api = axios.create({
 });
 
 export const companyApi = {
-  getAll: (page = 1, pageSize = 50) => 
-    api.get(`/api/companies?page=${page}&page_size=${pageSize}`),
+  getAll: (page = 1, pageSize = 50, cursor?: string) => 
+    api.get('/api/companies', { params: { page, page_size: pageSize, cursor } }),
   
   getByCode: (stockCode: string) => 
     api.get(`/api/companies/${stockCode}`),
@@ -21,15 +21,20 @@ export const companyApi = {
   
   getTrend: (stockCode: string) => 
     api.get(`/api/companies/${stockCode}/trend`),
+  
+  getTrendHistory: (stockCode: string, params: { start?: string; end?: string; window?: number } = {}) => 
+    api.get(`/api/companies/${stockCode}/trend/history`, { params }),
 };
 
 export const screenerApi = {
-  screen: (filters: object, page = 1, pageSize = 50) => 
-    api.post(`/api/screener?page=${page}&page_size=${pageSize}`, filters),
+  screen: (filters: object, page = 1, pageSize = 50, cursor?: string) => 
+    api.post('/api/screener', filters, { params: { page, page_size: pageSize, cursor } }),
 };
 
 export const metaApi = {
   getIndustries: () => api.get('/api/industries'),
+  getIndustryBenchmarks: (industry: string, params: { year?: number; season?: number } = {}) =>
+    api.get(`/api/industries/${encodeURIComponent(industry)}/benchmarks`, { params }),
   getSignals: () => api.get('/api/signals'),
 };
 
@@ -7,6 +7,7 @@ export interface Company {
   market?: string;
   listing_date?: string;
   capital?: number;
+  delisted_date?: string;
 }
 
 export interface Indicator {
@@ -25,8 +26,16 @@ export interface Indicator {
   quick_ratio?: number;
   debt_ratio?: number;
   cash_ratio?: number;
+  pe_ratio?: number;
   pe_ttm?: number;
   pb_ratio?: number;
+  ps_ratio?: number;
+  dividend_yield?: number;
+  interest_coverage?: number;
+  goodwill_ratio?: number;
+  short_debt_to_cash?: number;
+  short_debt_to_ev?: number;
+  landmine_flags: number;
   f_score?: number;
   cbs_score?: number;
   signal?: string;
@@ -47,6 +56,8 @@ export interface StockPrice {
 export interface CompanyDetail extends Company {
   latest_indicators?: Indicator;
   latest_price?: StockPrice;
+  // e.g. roe_industry_pct; only on screener results
+  percentiles?: Record<string, number | null>;
 }
 
 export interface ScreenerFilter {
@@ -62,11 +73,34 @@ export interface ScreenerFilter {
   signal?: string[];
   industry?: string[];
   market?: string[];
+  exclude_landmines?: LandmineFlag[];
+  require_landmines?: LandmineFlag[];
+  percentiles?: PercentileFilter[];
+  sort?: SortKey[];
 }
 
+export type PercentileScope = 'market' | 'industry';
+
+// Percentiles run 0-100, ascending: { column: 'roe', scope: 'industry', min: 90 } is the top 10%
+export interface PercentileFilter {
+  column: string;
+  scope: PercentileScope;
+  min?: number;
+  max?: number;
+}
+
+// Any numeric indicator column or percentile column, e.g. 'roe' or 'roe_industry_pct'
+export interface SortKey {
+  column: string;
+  descending?: boolean;
+}
+
+export type LandmineFlag = 'debt_servicing' | 'goodwill' | 'cash' | 'leverage' | 'short_debt';
+
 export interface ScreenerResult {
   total: number;
   companies: CompanyDetail[];
+  next_cursor?: string | null;
 }
 
 export interface TrendAnalysis {
@@ -82,9 +116,45 @@ export interface TrendAnalysis {
   r_squared?: number;
 }
 
+export interface TrendBandPoint {
+  date: string;
+  close: number;
+  trend_line?: number;
+  sd_plus_2?: number;
+  sd_plus_1?: number;
+  sd_minus_1?: number;
+  sd_minus_2?: number;
+}
+
+export interface TrendHistory {
+  company_id: number;
+  window: number;
+  as_of?: string;
+  points: TrendBandPoint[];
+}
+
+export interface IndustryIndicatorStat {
+  indicator: string;
+  companies: number;
+  p10?: number;
+  p25?: number;
+  median?: number;
+  p75?: number;
+  p90?: number;
+  mean?: number;
+}
+
+export interface IndustryBenchmark {
+  industry: string;
+  year?: number;
+  season?: number;
+  indicators: IndustryIndicatorStat[];
+}
+
 export interface PaginatedResponse<T> {
   total: number;
   page: number;
   page_size: number;
   items: T[];
+  next_cursor?: string | null;
 }
@@ -10,6 +10,7 @@ CREATE TABLE IF NOT EXISTS companies (
     market VARCHAR(20) CHECK (market IN ('上市', '上櫃', '興櫃')),
     listing_date DATE,
     capital BIGINT,
+    delisted_date DATE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -39,6 +40,7 @@ CREATE TABLE IF NOT EXISTS financial_reports (
     goodwill BIGINT,
     short_term_debt BIGINT,
     long_term_debt BIGINT,
+    common_stock BIGINT,
     
     -- 綜合損益表 (單位: 千元)
     revenue BIGINT,
@@ -47,6 +49,7 @@ CREATE TABLE IF NOT EXISTS financial_reports (
     operating_expenses BIGINT,
     operating_profit BIGINT,
     non_operating_income BIGINT,
+    interest_expense BIGINT,
     net_income BIGINT,
     net_income_attributable_to_parent BIGINT,
     eps DECIMAL(10, 2),
@@ -68,6 +71,7 @@ CREATE TABLE IF NOT EXISTS financial_reports (
 CREATE INDEX idx_financial_reports_company ON financial_reports(company_id);
 CREATE INDEX idx_financial_reports_date ON financial_reports(report_date);
 CREATE INDEX idx_financial_reports_year_season ON financial_reports(year, season);
+CREATE INDEX idx_financial_reports_updated_at ON financial_reports(updated_at);
 
 -- 股價數據
 CREATE TABLE IF NOT EXISTS stock_prices (
@@ -84,12 +88,74 @@ CREATE TABLE IF NOT EXISTS stock_prices (
     change_percent DECIMAL(5, 2),
     
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
     UNIQUE(company_id, date)
 );
 
 CREATE INDEX idx_stock_prices_company ON stock_prices(company_id);
 CREATE INDEX idx_stock_prices_date ON stock_prices(date);
+CREATE INDEX idx_stock_prices_updated_at ON stock_prices(updated_at);
+
+-- 歷史股價回補進度 (每檔股票已完成到哪個月)
+CREATE TABLE IF NOT EXISTS price_backfill_checkpoints (
+    company_id INTEGER PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+    start_month DATE NOT NULL,
+    last_completed_month DATE,
+    rows_fetched INTEGER DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 近四季 (TTM) 財務數據: 累計數拆成單季 (_q) 再滾動加總四季 (_ttm)
+CREATE TABLE IF NOT EXISTS financial_ttm (
+    company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    season INTEGER NOT NULL CHECK (season IN (1, 2, 3, 4)),
+    report_date DATE NOT NULL,
+    
+    revenue_q BIGINT,
+    cost_of_goods_sold_q BIGINT,
+    gross_profit_q BIGINT,
+    operating_profit_q BIGINT,
+    net_income_q BIGINT,
+    eps_q DECIMAL(10, 2),
+    interest_expense_q BIGINT,
+    operating_cash_flow_q BIGINT,
+    dividends_paid_q BIGINT,
+    
+    revenue_ttm BIGINT,
+    cost_of_goods_sold_ttm BIGINT,
+    gross_profit_ttm BIGINT,
+    operating_profit_ttm BIGINT,
+    net_income_ttm BIGINT,
+    eps_ttm DECIMAL(10, 2),
+    interest_expense_ttm BIGINT,
+    operating_cash_flow_ttm BIGINT,
+    dividends_paid_ttm BIGINT,
+    
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (company_id, year, season)
+);
+
+-- 每股基本面快取 (每日估值只需以收盤價除以這些數值)
+CREATE TABLE IF NOT EXISTS valuation_fundamentals (
+    company_id INTEGER PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    season INTEGER NOT NULL,
+    
+    shares BIGINT,
+    eps_annual DECIMAL(10, 2),
+    eps_ttm DECIMAL(10, 2),
+    book_value_per_share DECIMAL(12, 4),
+    sales_per_share DECIMAL(12, 4),
+    dividend_per_share DECIMAL(12, 4),
+    -- 千元; EV = 市值 + net_debt
+    short_term_debt BIGINT,
+    net_debt BIGINT,
+    
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
 
 -- 計算後指標 (自動更新)
 CREATE TABLE IF NOT EXISTS indicators (
@@ -137,6 +203,8 @@ CREATE TABLE IF NOT EXISTS indicators (
     goodwill_ratio DECIMAL(8, 4),
     short_debt_to_cash DECIMAL(8, 4),
     short_debt_to_ev DECIMAL(8, 4),
+    -- 排雷旗標 (bit 1: 還債能力, 2: 商譽, 4: 現金, 8: 槓桿, 16: 短期負債)
+    landmine_flags SMALLINT NOT NULL DEFAULT 0,
     
     -- 綜合評分
     f_score INTEGER CHECK (f_score >= 0 AND f_score <= 9),
@@ -153,6 +221,8 @@ CREATE INDEX idx_indicators_company ON indicators(company_id);
 CREATE INDEX idx_indicators_date ON indicators(report_date);
 CREATE INDEX idx_indicators_signal ON indicators(signal);
 CREATE INDEX idx_indicators_cbs_score ON indicators(cbs_score);
+CREATE INDEX idx_indicators_no_landmines ON indicators(company_id, report_date) WHERE landmine_flags = 0;
+CREATE INDEX idx_indicators_landmines ON indicators(company_id, report_date, landmine_flags) WHERE landmine_flags <> 0;
 
 -- 技術指標 / 五線譜
 CREATE TABLE IF NOT EXISTS trend_analysis (
@@ -177,6 +247,28 @@ CREATE TABLE IF NOT EXISTS trend_analysis (
 
 CREATE INDEX idx_trend_analysis_company ON trend_analysis(company_id);
 
+-- 五線譜迴歸累計量 (每日只加入新收盤價並移除滑出視窗的一筆, 定期全量重算校正誤差)
+CREATE TABLE IF NOT EXISTS trend_regression_state (
+    company_id INTEGER PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+    origin DATE NOT NULL,
+    window_start DATE NOT NULL,
+    window_end DATE NOT NULL,
+    n INTEGER NOT NULL,
+    
+    -- x = 距 origin 的天數, y = 收盤價
+    sum_x DOUBLE PRECISION NOT NULL,
+    sum_y DOUBLE PRECISION NOT NULL,
+    sum_xy DOUBLE PRECISION NOT NULL,
+    sum_xx DOUBLE PRECISION NOT NULL,
+    sum_yy DOUBLE PRECISION NOT NULL,
+    last_close DOUBLE PRECISION,
+    -- 已納入加總的股價列中最新的 updated_at; 視窗內有更新的列即需重算
+    prices_updated_at TIMESTAMP,
+    
+    computed_at TIMESTAMP NOT NULL,
+    refit_at TIMESTAMP
+);
+
 -- 產業中位數 (用於排雷比較)
 CREATE TABLE IF NOT EXISTS industry_benchmarks (
     id SERIAL PRIMARY KEY,
@@ -194,6 +286,26 @@ CREATE TABLE IF NOT EXISTS industry_benchmarks (
     UNIQUE(industry, year, season)
 );
 
+-- 產業指標分位數 (每產業、每季、每項指標一列)
+CREATE TABLE IF NOT EXISTS industry_indicator_stats (
+    industry VARCHAR(50) NOT NULL,
+    year INTEGER NOT NULL,
+    season INTEGER NOT NULL,
+    indicator VARCHAR(50) NOT NULL,
+    companies INTEGER NOT NULL,
+    
+    p10 DECIMAL(14, 4),
+    p25 DECIMAL(14, 4),
+    median DECIMAL(14, 4),
+    p75 DECIMAL(14, 4),
+    p90 DECIMAL(14, 4),
+    mean DECIMAL(14, 4),
+    
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (industry, year, season, indicator)
+);
+
 -- 爬蟲執行記錄
 CREATE TABLE IF NOT EXISTS crawler_logs (
     id SERIAL PRIMARY KEY,
@@ -209,6 +321,99 @@ CREATE TABLE IF NOT EXISTS crawler_logs (
 CREATE INDEX idx_crawler_logs_task ON crawler_logs(task_name);
 CREATE INDEX idx_crawler_logs_status ON crawler_logs(status);
 
+-- 增量計算水位 (各排程上次成功執行時間, 之後變動的公司才需重算)
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job_name VARCHAR(100) PRIMARY KEY,
+    last_run_at TIMESTAMP NOT NULL,
+    companies_processed INTEGER DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 選股快照: 每家未下市公司一列最新指標 + 公司資料 + 最新股價 (指標/估值排程結束時 REFRESH CONCURRENTLY)
+-- *_market_pct / *_industry_pct: 全市場 / 同產業百分位 (0-100, 由小到大); 指標為 NULL 者不參與排名
+CREATE MATERIALIZED VIEW IF NOT EXISTS latest_indicator_snapshot AS
+WITH latest AS (
+    SELECT
+        c.id AS company_id, c.stock_code, c.name, c.name_abbr, c.industry, c.market,
+        c.listing_date, c.capital, c.delisted_date,
+    
+        i.id AS indicator_id, i.report_date, i.year, i.season,
+        i.roe, i.net_margin, i.asset_turnover, i.equity_multiplier,
+        i.gross_margin, i.operating_margin,
+        i.inventory_turnover, i.inventory_turnover_days, i.accounts_receivable_turnover_days, i.cash_conversion_cycle,
+        i.current_ratio, i.quick_ratio, i.debt_ratio, i.interest_coverage,
+        i.cash_ratio, i.cash_flow_ratio, i.free_cash_flow_per_share,
+        i.pe_ratio, i.pe_ttm, i.pb_ratio, i.ps_ratio, i.dividend_yield,
+        i.goodwill_ratio, i.short_debt_to_cash, i.short_debt_to_ev, i.landmine_flags,
+        i.f_score, i.cbs_score, i.signal,
+    
+        p.id AS price_id, p.date AS price_date, p.open, p.high, p.low, p.close, p.volume, p.change_percent
+    FROM companies c
+    CROSS JOIN LATERAL (
+        SELECT * FROM indicators
+        WHERE company_id = c.id
+        ORDER BY report_date DESC LIMIT 1
+    ) i
+    LEFT JOIN LATERAL (
+        SELECT * FROM stock_prices
+        WHERE company_id = c.id
+        ORDER BY date DESC LIMIT 1
+    ) p ON TRUE
+    WHERE c.delisted_date IS NULL
+)
+SELECT
+    latest.*,
+    (CASE WHEN roe IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY roe IS NULL ORDER BY roe) END)::numeric(5,2) AS roe_market_pct,
+    (CASE WHEN roe IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, roe IS NULL ORDER BY roe) END)::numeric(5,2) AS roe_industry_pct,
+    (CASE WHEN net_margin IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY net_margin IS NULL ORDER BY net_margin) END)::numeric(5,2) AS net_margin_market_pct,
+    (CASE WHEN net_margin IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, net_margin IS NULL ORDER BY net_margin) END)::numeric(5,2) AS net_margin_industry_pct,
+    (CASE WHEN gross_margin IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY gross_margin IS NULL ORDER BY gross_margin) END)::numeric(5,2) AS gross_margin_market_pct,
+    (CASE WHEN gross_margin IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, gross_margin IS NULL ORDER BY gross_margin) END)::numeric(5,2) AS gross_margin_industry_pct,
+    (CASE WHEN operating_margin IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY operating_margin IS NULL ORDER BY operating_margin) END)::numeric(5,2) AS operating_margin_market_pct,
+    (CASE WHEN operating_margin IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, operating_margin IS NULL ORDER BY operating_margin) END)::numeric(5,2) AS operating_margin_industry_pct,
+    (CASE WHEN asset_turnover IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY asset_turnover IS NULL ORDER BY asset_turnover) END)::numeric(5,2) AS asset_turnover_market_pct,
+    (CASE WHEN asset_turnover IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, asset_turnover IS NULL ORDER BY asset_turnover) END)::numeric(5,2) AS asset_turnover_industry_pct,
+    (CASE WHEN current_ratio IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY current_ratio IS NULL ORDER BY current_ratio) END)::numeric(5,2) AS current_ratio_market_pct,
+    (CASE WHEN current_ratio IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, current_ratio IS NULL ORDER BY current_ratio) END)::numeric(5,2) AS current_ratio_industry_pct,
+    (CASE WHEN quick_ratio IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY quick_ratio IS NULL ORDER BY quick_ratio) END)::numeric(5,2) AS quick_ratio_market_pct,
+    (CASE WHEN quick_ratio IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, quick_ratio IS NULL ORDER BY quick_ratio) END)::numeric(5,2) AS quick_ratio_industry_pct,
+    (CASE WHEN debt_ratio IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY debt_ratio IS NULL ORDER BY debt_ratio) END)::numeric(5,2) AS debt_ratio_market_pct,
+    (CASE WHEN debt_ratio IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, debt_ratio IS NULL ORDER BY debt_ratio) END)::numeric(5,2) AS debt_ratio_industry_pct,
+    (CASE WHEN cash_ratio IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY cash_ratio IS NULL ORDER BY cash_ratio) END)::numeric(5,2) AS cash_ratio_market_pct,
+    (CASE WHEN cash_ratio IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, cash_ratio IS NULL ORDER BY cash_ratio) END)::numeric(5,2) AS cash_ratio_industry_pct,
+    (CASE WHEN pe_ttm IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY pe_ttm IS NULL ORDER BY pe_ttm) END)::numeric(5,2) AS pe_ttm_market_pct,
+    (CASE WHEN pe_ttm IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, pe_ttm IS NULL ORDER BY pe_ttm) END)::numeric(5,2) AS pe_ttm_industry_pct,
+    (CASE WHEN pb_ratio IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY pb_ratio IS NULL ORDER BY pb_ratio) END)::numeric(5,2) AS pb_ratio_market_pct,
+    (CASE WHEN pb_ratio IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, pb_ratio IS NULL ORDER BY pb_ratio) END)::numeric(5,2) AS pb_ratio_industry_pct,
+    (CASE WHEN ps_ratio IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY ps_ratio IS NULL ORDER BY ps_ratio) END)::numeric(5,2) AS ps_ratio_market_pct,
+    (CASE WHEN ps_ratio IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, ps_ratio IS NULL ORDER BY ps_ratio) END)::numeric(5,2) AS ps_ratio_industry_pct,
+    (CASE WHEN dividend_yield IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY dividend_yield IS NULL ORDER BY dividend_yield) END)::numeric(5,2) AS dividend_yield_market_pct,
+    (CASE WHEN dividend_yield IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, dividend_yield IS NULL ORDER BY dividend_yield) END)::numeric(5,2) AS dividend_yield_industry_pct,
+    (CASE WHEN f_score IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY f_score IS NULL ORDER BY f_score) END)::numeric(5,2) AS f_score_market_pct,
+    (CASE WHEN f_score IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, f_score IS NULL ORDER BY f_score) END)::numeric(5,2) AS f_score_industry_pct,
+    (CASE WHEN cbs_score IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY cbs_score IS NULL ORDER BY cbs_score) END)::numeric(5,2) AS cbs_score_market_pct,
+    (CASE WHEN cbs_score IS NOT NULL AND industry IS NOT NULL THEN 100 * percent_rank() OVER (PARTITION BY industry, cbs_score IS NULL ORDER BY cbs_score) END)::numeric(5,2) AS cbs_score_industry_pct
+FROM latest;
+
+-- REFRESH ... CONCURRENTLY 需要唯一索引
+CREATE UNIQUE INDEX idx_snapshot_company ON latest_indicator_snapshot(company_id);
+CREATE INDEX idx_snapshot_stock_code ON latest_indicator_snapshot(stock_code);
+CREATE INDEX idx_snapshot_industry ON latest_indicator_snapshot(industry);
+CREATE INDEX idx_snapshot_market ON latest_indicator_snapshot(market);
+CREATE INDEX idx_snapshot_signal ON latest_indicator_snapshot(signal);
+-- 常用排序的索引與篩選器的 ORDER BY 相同 (NULLS LAST, 再以 stock_code 排序), 排序後取前 N 筆不需全排序;
+-- 其他欄位與方向直接排序快照 (每家公司一列)
+CREATE INDEX idx_snapshot_roe ON latest_indicator_snapshot(roe DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_pe_ttm ON latest_indicator_snapshot(pe_ttm, stock_code);
+CREATE INDEX idx_snapshot_pb_ratio ON latest_indicator_snapshot(pb_ratio, stock_code);
+CREATE INDEX idx_snapshot_current_ratio ON latest_indicator_snapshot(current_ratio DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_dividend_yield ON latest_indicator_snapshot(dividend_yield DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_f_score ON latest_indicator_snapshot(f_score DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_cbs_score ON latest_indicator_snapshot(cbs_score DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_roe_market_pct ON latest_indicator_snapshot(roe_market_pct DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_roe_industry_pct ON latest_indicator_snapshot(roe_industry_pct DESC NULLS LAST, stock_code);
+CREATE INDEX idx_snapshot_no_landmines ON latest_indicator_snapshot(stock_code) WHERE landmine_flags = 0;
+
 -- 更新時間觸發器
 CREATE OR REPLACE FUNCTION update_updated_at()
 RETURNS TRIGGER AS $$
@@ -232,3 +437,13 @@ CREATE TRIGGER update_indicators_updated_at
     BEFORE UPDATE ON indicators
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at();
+
+CREATE TRIGGER update_financial_ttm_updated_at
+    BEFORE UPDATE ON financial_ttm
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at();
+
+CREATE TRIGGER update_stock_prices_updated_at
+    BEFORE UPDATE ON stock_prices
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at();